@@ -1,34 +1,28 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+import os
 import time
+import asyncio
 import re
 import json
 import random
-from crawler import crawl_site, crawl_site_recursive
-from ingest import add_content_to_store, add_multiple_contents_to_store
+from collections import deque
 from vector_store import clear_vector_store
 from query import fast_query
-from bot import chat_with_bot
+from bot import chat_with_bot, stream_chat_with_bot, clean_urls, empty_response
 from retail_crawler import retail_crawler
 from kimi_service import kimi_service
-from urllib.parse import urlparse
-
-# Track last crawled domain
-last_crawled_domain = None
-
-
-def update_last_domain(url):
-    global last_crawled_domain
-    try:
-        domain = urlparse(url).netloc
-        if domain:
-            last_crawled_domain = domain
-            print(f"DEBUG: Updated last_crawled_domain to: {last_crawled_domain}")
-    except Exception:
-        pass
-
+from browser_pool import browser_pool
+from http_fetcher import http_fetcher
+from asset_processor import asset_processor
+from job_queue import job_queue
+from extraction_cache import extraction_cache
+from image_cache import image_cache
+from wrapper_induction import wrapper_induction
+from rate_limiter import llm_limiter
 
 # ✅ FORMAT RESPONSE FOR FRONTEND (VERY IMPORTANT)
 def format_response(res):
@@ -126,22 +120,12 @@ def rebuild_carousel_with_map(content, lookup_map):
     return result
 
 
-async def background_ingest(url: str, max_pages: int = 1):
-    try:
-        print(f"Background ingestion started for: {url} (max_pages={max_pages})")
-        if max_pages <= 1:
-            content, _ = await crawl_site(url)
-            if content and len(content.strip()) > 10:
-                await add_content_to_store(content, {"source": url})
-                update_last_domain(url)
-        else:
-            results = await crawl_site_recursive(url, max_pages=max_pages)
-            if results:
-                await add_multiple_contents_to_store(results)
-                print(f"Background deep ingestion complete for {url}")
-    except Exception as e:
-        print(f"Error in background ingestion for {url}: {e}")
+# Max live searches started speculatively (before RAG strength is known) at any one time
+SPECULATIVE_LIVE_SEARCHES = int(os.getenv("SPECULATIVE_LIVE_SEARCHES", 4))
+speculation_stats = {"started": 0, "used": 0, "cancelled": 0, "skipped": 0, "in_flight": 0}
 
+# Recent /chat/stream time-to-first-token samples, reported by /stats
+ttft_samples = deque(maxlen=500)
 
 app = FastAPI(title="Retail AI RAG API")
 
@@ -154,6 +138,20 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def startup_event():
+    # Warm the Chromium pool once so crawls and image searches skip the browser cold-start
+    await browser_pool.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await browser_pool.close()
+    await http_fetcher.close()
+    await asset_processor.close()
+    image_cache.close()
+
+
 class CrawlRequest(BaseModel):
     url: str
 
@@ -163,19 +161,29 @@ class ChatRequest(BaseModel):
 
 
 @app.post("/crawl")
-async def crawl_endpoint(request: CrawlRequest, background_tasks: BackgroundTasks):
+async def crawl_endpoint(request: CrawlRequest):
     if not request.url.startswith("http"):
         raise HTTPException(status_code=400, detail="Invalid URL protocol")
-    background_tasks.add_task(background_ingest, request.url, max_pages=1)
-    return {"status": "success", "message": f"Ingestion started for {request.url}"}
+    job_id, deduped = job_queue.enqueue("crawl", {"url": request.url})
+    message = f"Ingestion already in progress for {request.url}" if deduped else f"Ingestion started for {request.url}"
+    return {"status": "success", "job_id": job_id, "message": message}
 
 
 @app.post("/crawl/deep")
-async def deep_crawl_endpoint(request: CrawlRequest, background_tasks: BackgroundTasks):
+async def deep_crawl_endpoint(request: CrawlRequest):
     if not request.url.startswith("http"):
         raise HTTPException(status_code=400, detail="Invalid URL protocol")
-    background_tasks.add_task(background_ingest, request.url, max_pages=15)
-    return {"status": "success", "message": "Deep ingestion started"}
+    job_id, deduped = job_queue.enqueue("deep_crawl", {"url": request.url, "max_pages": 15})
+    message = "Deep ingestion already in progress" if deduped else "Deep ingestion started"
+    return {"status": "success", "job_id": job_id, "message": message}
+
+
+@app.get("/jobs/{job_id}")
+async def job_status_endpoint(job_id: str):
+    job = job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 @app.post("/clear")
@@ -184,63 +192,72 @@ async def clear_endpoint():
     return {"status": "success", "message": "Memory cleared successfully"}
 
 
-# -------------------------------
-# BACKGROUND TASK HELPER
-# -------------------------------
-async def background_crawl_and_ingest(query: str, fast_products: list):
-    try:
-        print(f"🔄 BACKGROUND: Starting deep crawl for '{query}'...")
-        deep_results = await kimi_service.run_deep_crawl_process(query, fast_products)
-        if deep_results:
-            print(f"🔄 BACKGROUND: Deep crawl yielded {len(deep_results)} rich products. Saving to DB...")
-            await kimi_service.cache_and_store_products(deep_results, query)
-        print(f"✅ BACKGROUND: Completely finished processing '{query}'!")
-    except Exception as e:
-        print(f"❌ BACKGROUND: Failed deep crawl for '{query}': {e}")
-        import traceback
-        traceback.print_exc()
+def start_speculative_live_search(query):
+    """
+    Starts get_fast_bing_data in the background unless the speculation budget
+    (SPECULATIVE_LIVE_SEARCHES concurrent searches, 0 disables) is used up.
+    """
+    if speculation_stats["in_flight"] >= SPECULATIVE_LIVE_SEARCHES:
+        speculation_stats["skipped"] += 1
+        return None
+    speculation_stats["started"] += 1
+    speculation_stats["in_flight"] += 1
+    task = asyncio.create_task(kimi_service.get_fast_bing_data(query))
 
-@app.post("/chat")
-async def chat_endpoint(request: ChatRequest, background_tasks: BackgroundTasks):
+    def finished(_):
+        speculation_stats["in_flight"] -= 1
+
+    task.add_done_callback(finished)
+    return task
+
+
+async def prepare_chat(query: str):
+    """
+    Shared preamble of /chat and /chat/stream: intent detection, image/vehicle shortcuts,
+    RAG lookup and fast live search. Returns {"response": ...} when no bot call is needed,
+    otherwise the bot inputs plus the verified lookup map for carousel reconstruction.
+    """
     start_time = time.time()
-    try:
-        query = request.message.strip()
-        query_lower = query.lower()
-        print(f"\n🔥 Query: {query}")
-
-        # -------------------------------
-        # 🧠 INTENT DETECTION
-        # -------------------------------
-        intent = kimi_service.detect_intent(query_lower)
-        print(f"🧠 Intent: {intent} (Took {time.time() - start_time:.2f}s)")
-
-        # -------------------------------
-        # 🖼️ IMAGE SEARCH OVERRIDE (PRIORITY)
-        # -------------------------------
-        # If user explicitly asks for images/photos, use the optimized Bing searcher
-        if any(x in query_lower for x in ["image", "photo", "pic", "picture", "show me", "images"]):
-            print(f"🖼️ Image Search Override for: {query}")
-            img_results = await kimi_service.search_images(query)
-            if img_results and img_results.get("results"):
-                return {"status": "success", "response": format_response(img_results)}
-
-        # -------------------------------
-        # 🚗 VEHICLE FLOW
-        # -------------------------------
-        if intent == "vehicle":
-            print("🚗 Vehicle flow")
-            result = await kimi_service.get_vehicle_data(query)
-            return {"status": "success", "response": format_response(result)}
-
-        # -------------------------------
-        # 🛒 SHOPPING FLOW
-        # -------------------------------
-        live_products = []
-        local_results = []
-        if intent == "shopping":
-            rag_start = time.time()
+    query_lower = query.lower()
+    print(f"\n🔥 Query: {query}")
+
+    # -------------------------------
+    # 🧠 INTENT DETECTION
+    # -------------------------------
+    intent = kimi_service.detect_intent(query_lower)
+    print(f"🧠 Intent: {intent} (Took {time.time() - start_time:.2f}s)")
+
+    # -------------------------------
+    # 🖼️ IMAGE SEARCH OVERRIDE (PRIORITY)
+    # -------------------------------
+    # If user explicitly asks for images/photos, use the optimized Bing searcher
+    if any(x in query_lower for x in ["image", "photo", "pic", "picture", "show me", "images"]):
+        print(f"🖼️ Image Search Override for: {query}")
+        img_results = await kimi_service.search_images(query)
+        if img_results and img_results.get("results"):
+            return {"response": format_response(img_results)}
+
+    # -------------------------------
+    # 🚗 VEHICLE FLOW
+    # -------------------------------
+    if intent == "vehicle":
+        print("🚗 Vehicle flow")
+        result = await kimi_service.get_vehicle_data(query)
+        return {"response": format_response(result)}
+
+    # -------------------------------
+    # 🛒 SHOPPING FLOW
+    # -------------------------------
+    live_products = []
+    local_results = []
+    if intent == "shopping":
+        rag_start = time.time()
+        # Speculatively start the live search alongside RAG, so weak-RAG queries
+        # only wait for the slower of the two instead of both in sequence
+        live_task = start_speculative_live_search(query)
+        try:
             # ONLY search in 'retail' category to avoid pulling generic docs/tutorials
-            local_results = fast_query(query, category="retail", threshold=1.2)
+            local_results = await asyncio.to_thread(fast_query, query, category="retail", threshold=1.2)
             print(f"🛒 RAG Check: Found {len(local_results)} docs (Took {time.time() - rag_start:.2f}s)")
             # Shuffle for variety: every search shows a different mix from the full cached pool
             random.shuffle(local_results)
@@ -248,7 +265,7 @@ async def chat_endpoint(request: ChatRequest, background_tasks: BackgroundTasks)
             # Check if we have at least 2 items with images. 
             # If not, we definitely need live data.
             results_with_images = [r for r in local_results if r[0].metadata.get("image_url") or r[0].metadata.get("s3_image_url")]
-            
+        
             # Hotlink Block Prevention: Identify domains that break in the browser (Nike, Prada, etc)
             # If they don't have an S3 URL yet, they are "dangerous" to show.
             blocked_domains = ["nike.com", "prada.com", "ajio.com"]
@@ -257,15 +274,15 @@ async def chat_endpoint(request: ChatRequest, background_tasks: BackgroundTasks)
                 doc = r[0]
                 img = doc.metadata.get("image_url") or ""
                 s3 = doc.metadata.get("s3_image_url") or ""
-                
+            
                 is_blocked = any(d in img.lower() for d in blocked_domains)
                 has_s3 = "amazonaws.com" in s3.lower() or "amazonaws.com" in img.lower()
-                
+            
                 if is_blocked and not has_s3:
                     print(f"⚠️ RAG Warning: Dropped {img} because it belongs to a blocked-hotlink domain and has no S3 backup.")
                     continue
                 safe_results.append(r)
-            
+        
             results_with_images = safe_results
 
             # Strict Keyword Heuristic: Prevent Semantic Bleed (e.g., matching Prada when asking for Nike)
@@ -284,98 +301,183 @@ async def chat_endpoint(request: ChatRequest, background_tasks: BackgroundTasks)
                         results_with_images = []
                         local_results = []
                         break
-            
+        
             # PROACTIVE: Even if we have some RAG hits, if it's a "fresh" shopping query (few visual hits)
             # we fetch fast basic data to show instantly, and do the heavy crawl in the background!
             if len(results_with_images) < 4:
                 print(f"🛒 Limited visual local results ({len(results_with_images)}). Fetching fast Bing data...")
                 kimi_start = time.time()
-                live_products = await kimi_service.get_fast_bing_data(query) # INSTANT RESPONSE!
-                print(f"⚡ Fast Search: Found {len(live_products)} basic products (Took {time.time() - kimi_start:.2f}s)")
+                if live_task is not None:
+                    speculation_stats["used"] += 1
+                    live_products = await live_task
+                else:
+                    live_products = await kimi_service.get_fast_bing_data(query) # INSTANT RESPONSE!
+                print(f"⚡ Fast Search: Found {len(live_products)} basic products (Waited {time.time() - kimi_start:.2f}s)")
 
                 if live_products:
-                    # Fire-and-forget the heavy crawling and S3 uploading!
-                    # It will run transparently after we send the fast UI response.
-                    background_tasks.add_task(background_crawl_and_ingest, query, live_products)
+                    # Hand the heavy crawling and S3 uploading to the worker process!
+                    # Repeated queries for the same thing share one in-flight job.
+                    job_queue.enqueue("live_enrich", {"query": query, "products": live_products},
+                                      dedupe_key=f"live_enrich:{query_lower}")
             else:
                 print(f"🛒 Strong RAG Presence ({len(results_with_images)} visual docs). Using local store.")
+        finally:
+            # Unconsumed speculation (strong RAG, an error or a disconnect) must not keep running
+            if live_task is not None and not live_task.done():
+                live_task.cancel()
+                speculation_stats["cancelled"] += 1
+
+    # -------------------------------
+    # 🌐 FALLBACK / BOT RESPONSE
+    # -------------------------------
+    # 🤖 BOT RESPONSE GENERATION
+    # -------------------------------
+    # Build a lookup map for the re-constructor
+    lookup_map = {}
+    # From Live Products
+    for p in live_products:
+        name = str(p.get("name") or "Product").strip().lower()
+        if name not in lookup_map:
+            lookup_map[name] = {
+                "name": p.get("name"),
+                "price": p.get("price") or "Check Site",
+                "image_url": p.get("image_url"),
+                "source_url": p.get("url") or p.get("source_url")
+            }
+    # From RAG Results — prefer s3_image_url, skip products with no image at all
+    for doc, score in local_results:
+        name = str(doc.metadata.get("name") or doc.metadata.get("Product Name") or f"Option {len(lookup_map)+1}").strip().lower()
+        img = doc.metadata.get("s3_image_url") or doc.metadata.get("image_url")
+        # Skip products with no image — they cause "Sorry, photo not available" in the UI
+        if not img:
+            continue
+        if name not in lookup_map:
+            lookup_map[name] = {
+                "name": doc.metadata.get("name") or "Product",
+                "price": doc.metadata.get("price") or "Market Price",
+                "image_url": img,
+                "source_url": doc.metadata.get("source") or doc.metadata.get("source_url")
+            }
+
+    return {
+        "intent": intent,
+        "live_products": live_products,
+        "local_results": local_results,
+        "lookup_map": lookup_map,
+    }
+
+
+def finalize_bot_response(bot_response, intent, lookup_map):
+    # 4. Final Formatting & Re-construction
+    final_response = format_response(bot_response)
+    # Rebuild the carousel from our verified map to prevent hallucinations!
+    final_response = rebuild_carousel_with_map(final_response, lookup_map)
+
+    # 5. If the carousel still has < 5 products, forcefully pad from the lookup_map
+    #    This happens when strong RAG data exists but the bot only mentioned 3 names.
+    if intent == "shopping" and lookup_map:
+        carousel_match = re.search(r'<product_carousel>\s*(\[.*?\])\s*</product_carousel>', final_response, re.DOTALL)
+        if carousel_match:
+            try:
+                current_items = json.loads(carousel_match.group(1))
+                if len(current_items) < 5:
+                    print(f"DEBUG: Carousel has only {len(current_items)} items. Padding from lookup_map...")
+                    # Collect current source_urls to de-duplicate
+                    existing_sources = {p.get('source_url') for p in current_items}
+                    # Shuffle lookup values so we pick different items each time
+                    all_candidates = list(lookup_map.values())
+                    random.shuffle(all_candidates)
+                    # Pick diverse items from the lookup_map, skipping already shown ones
+                    for p in all_candidates:
+                        if len(current_items) >= 10:
+                            break
+                        if p.get('source_url') not in existing_sources and p.get('image_url'):
+                            current_items.append(p)
+                            existing_sources.add(p.get('source_url'))
+                    # Replace the carousel in the final response
+                    rebuilt = json.dumps(current_items, separators=(',', ':'), ensure_ascii=False)
+                    final_response = final_response[:carousel_match.start(1)] + rebuilt + final_response[carousel_match.end(1):]
+                    print(f"DEBUG: Padded carousel to {len(current_items)} items.")
+            except Exception as pad_err:
+                print(f"DEBUG: Carousel padding failed: {pad_err}")
+
+    return final_response
+
+
+def split_carousel(text):
+    """
+    Separates the verified carousel from a formatted response: (text, products or None).
+    """
+    match = re.search(r'<product_carousel>\s*(\[.*?\])\s*</product_carousel>', text, re.DOTALL)
+    if not match:
+        return text, None
+    try:
+        products = json.loads(match.group(1))
+    except ValueError:
+        return text, None
+    return (text[:match.start()] + text[match.end():]).strip(), products
+
+
+CAROUSEL_OPEN = "<product_carousel>"
+CAROUSEL_CLOSE = "</product_carousel>"
+
+
+def take_visible_text(buffer, in_carousel):
+    """
+    Splits streamed bot text into what can be shown now and what must be held back.
+    The bot's own carousel is never streamed (it is rebuilt from verified data at the end),
+    and a possibly partial "<product_carousel>" tag at the end of the buffer is kept for later.
+    Returns (visible, remaining_buffer, in_carousel).
+    """
+    visible = []
+    while True:
+        if in_carousel:
+            end = buffer.find(CAROUSEL_CLOSE)
+            if end == -1:
+                return "".join(visible), buffer, True
+            buffer = buffer[end + len(CAROUSEL_CLOSE):]
+            in_carousel = False
+            continue
+        start = buffer.find(CAROUSEL_OPEN)
+        if start != -1:
+            visible.append(buffer[:start])
+            buffer = buffer[start + len(CAROUSEL_OPEN):]
+            in_carousel = True
+            continue
+        hold = 0
+        for k in range(min(len(CAROUSEL_OPEN) - 1, len(buffer)), 0, -1):
+            if buffer.endswith(CAROUSEL_OPEN[:k]):
+                hold = k
+                break
+        visible.append(buffer[:len(buffer) - hold])
+        return "".join(visible), buffer[len(buffer) - hold:], False
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-        # -------------------------------
-        # 🌐 FALLBACK / BOT RESPONSE
-        # -------------------------------
-        # 🤖 BOT RESPONSE GENERATION
-        # -------------------------------
-        # Build a lookup map for the re-constructor
-        lookup_map = {}
-        # From Live Products
-        for p in live_products:
-            name = str(p.get("name") or "Product").strip().lower()
-            if name not in lookup_map:
-                lookup_map[name] = {
-                    "name": p.get("name"),
-                    "price": p.get("price") or "Check Site",
-                    "image_url": p.get("image_url"),
-                    "source_url": p.get("url") or p.get("source_url")
-                }
-        # From RAG Results — prefer s3_image_url, skip products with no image at all
-        for doc, score in local_results:
-            name = str(doc.metadata.get("name") or doc.metadata.get("Product Name") or f"Option {len(lookup_map)+1}").strip().lower()
-            img = doc.metadata.get("s3_image_url") or doc.metadata.get("image_url")
-            # Skip products with no image — they cause "Sorry, photo not available" in the UI
-            if not img:
-                continue
-            if name not in lookup_map:
-                lookup_map[name] = {
-                    "name": doc.metadata.get("name") or "Product",
-                    "price": doc.metadata.get("price") or "Market Price",
-                    "image_url": img,
-                    "source_url": doc.metadata.get("source") or doc.metadata.get("source_url")
-                }
+
+@app.post("/chat")
+async def chat_endpoint(request: ChatRequest):
+    start_time = time.time()
+    try:
+        query = request.message.strip()
+        chat = await prepare_chat(query)
+        if "response" in chat:
+            return {"status": "success", "response": chat["response"]}
 
         bot_start = time.time()
         print(f"🤖 Bot is generating response for: {query}")
         bot_response = await chat_with_bot(
             query=query, 
-            live_context=live_products,
-            intent_type=intent,
-            local_docs=local_results
+            live_context=chat["live_products"],
+            intent_type=chat["intent"],
+            local_docs=chat["local_results"]
         )
         
         # ✅ UTILITY: SHARING LOGS FOR DEBUGGING
         print(f"✅ Bot Done. Response length: {len(bot_response)}")
-        
-        # 4. Final Formatting & Re-construction
-        final_response = format_response(bot_response)
-        # Rebuild the carousel from our verified map to prevent hallucinations!
-        final_response = rebuild_carousel_with_map(final_response, lookup_map)
-
-        # 5. If the carousel still has < 5 products, forcefully pad from the lookup_map
-        #    This happens when strong RAG data exists but the bot only mentioned 3 names.
-        if intent == "shopping" and lookup_map:
-            carousel_match = re.search(r'<product_carousel>\s*(\[.*?\])\s*</product_carousel>', final_response, re.DOTALL)
-            if carousel_match:
-                try:
-                    current_items = json.loads(carousel_match.group(1))
-                    if len(current_items) < 5:
-                        print(f"DEBUG: Carousel has only {len(current_items)} items. Padding from lookup_map...")
-                        # Collect current source_urls to de-duplicate
-                        existing_sources = {p.get('source_url') for p in current_items}
-                        # Shuffle lookup values so we pick different items each time
-                        all_candidates = list(lookup_map.values())
-                        random.shuffle(all_candidates)
-                        # Pick diverse items from the lookup_map, skipping already shown ones
-                        for p in all_candidates:
-                            if len(current_items) >= 10:
-                                break
-                            if p.get('source_url') not in existing_sources and p.get('image_url'):
-                                current_items.append(p)
-                                existing_sources.add(p.get('source_url'))
-                        # Replace the carousel in the final response
-                        rebuilt = json.dumps(current_items, separators=(',', ':'), ensure_ascii=False)
-                        final_response = final_response[:carousel_match.start(1)] + rebuilt + final_response[carousel_match.end(1):]
-                        print(f"DEBUG: Padded carousel to {len(current_items)} items.")
-                except Exception as pad_err:
-                    print(f"DEBUG: Carousel padding failed: {pad_err}")
+        final_response = finalize_bot_response(bot_response, chat["intent"], chat["lookup_map"])
 
         print(f"✅ Bot Done (Took {time.time() - bot_start:.2f}s)")
         print(f"🚀 Total Response Time: {time.time() - start_time:.2f}s")
@@ -388,6 +490,98 @@ async def chat_endpoint(request: ChatRequest, background_tasks: BackgroundTasks)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Server-Sent Events variant of /chat: "token" events carry summary text as it is generated,
+    a "carousel" event carries the verified products once names are resolved, and "done"
+    reports time-to-first-token.
+    """
+    start_time = time.time()
+    query = request.message.strip()
+
+    async def events():
+        first_token_at = None
+        try:
+            chat = await prepare_chat(query)
+            if "response" in chat:
+                text, products = split_carousel(chat["response"])
+                first_token_at = time.time()
+                if text:
+                    yield sse_event("token", {"text": text})
+                if products is not None:
+                    yield sse_event("carousel", {"products": products})
+            else:
+                print(f"🤖 Bot is streaming response for: {query}")
+                raw_chunks = []
+                buffer = ""
+                in_carousel = False
+                async for chunk in stream_chat_with_bot(
+                    query=query,
+                    live_context=chat["live_products"],
+                    intent_type=chat["intent"],
+                    local_docs=chat["local_results"]
+                ):
+                    raw_chunks.append(chunk)
+                    visible, buffer, in_carousel = take_visible_text(buffer + chunk, in_carousel)
+                    if visible:
+                        if first_token_at is None:
+                            first_token_at = time.time()
+                            print(f"⏱️ Time to first token: {first_token_at - start_time:.2f}s")
+                        yield sse_event("token", {"text": clean_urls(visible)})
+                if buffer and not in_carousel:
+                    yield sse_event("token", {"text": clean_urls(buffer)})
+
+                bot_response = clean_urls("".join(raw_chunks))
+                if not bot_response.strip():
+                    bot_response = empty_response(chat["intent"])
+                    first_token_at = first_token_at or time.time()
+                    yield sse_event("token", {"text": bot_response})
+                _, products = split_carousel(finalize_bot_response(bot_response, chat["intent"], chat["lookup_map"]))
+                if products is not None:
+                    yield sse_event("carousel", {"products": products})
+
+            ttft = (first_token_at or time.time()) - start_time
+            ttft_samples.append(ttft)
+            print(f"🚀 Total Streamed Response Time: {time.time() - start_time:.2f}s (TTFT {ttft:.2f}s)")
+            yield sse_event("done", {"ttft": round(ttft, 3), "total": round(time.time() - start_time, 3)})
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def ttft_stats():
+    samples = sorted(ttft_samples)
+    if not samples:
+        return {"samples": 0}
+    return {
+        "samples": len(samples),
+        "p50": round(samples[len(samples) // 2], 3),
+        "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+    }
+
+
+@app.get("/stats")
+async def stats_endpoint():
+    return {
+        "extraction_cache": extraction_cache.stats(),
+        "image_cache": image_cache.stats(),
+        "image_downloads": asset_processor.stats(),
+        "wrapper_templates": wrapper_induction.stats(),
+        "browser_pool": browser_pool.stats(),
+        "llm_limiter": llm_limiter.stats(),
+        "chat_ttft": ttft_stats(),
+        "speculative_live_search": dict(speculation_stats),
+    }
+
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
@@ -1,11 +1,71 @@
+import asyncio
 import httpx
-import uuid
+import os
+import hashlib
+from urllib.parse import urlparse
 from s3_service import s3_service
 from kimi_service import kimi_service
+
+# Images downloaded at once overall, and per image host (CDNs throttle aggressive clients)
+IMAGE_DOWNLOAD_CONCURRENCY = int(os.getenv("IMAGE_DOWNLOAD_CONCURRENCY", 16))
+IMAGE_HOST_CONCURRENCY = int(os.getenv("IMAGE_HOST_CONCURRENCY", 4))
+# Bodies under the floor are tracking pixels and icons; over the cap, oversized originals
+IMAGE_MIN_BYTES = 1000
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", 8 * 1024 * 1024))
+# Content types some CDNs send for real images; anything else non-image/* is an error page
+GENERIC_CONTENT_TYPES = {"", "application/octet-stream", "binary/octet-stream"}
+# Sniffed format -> (S3 key extension, stored Content-Type)
+IMAGE_FORMATS = {
+    "jpeg": ("jpg", "image/jpeg"),
+    "png": ("png", "image/png"),
+    "gif": ("gif", "image/gif"),
+    "webp": ("webp", "image/webp"),
+    "avif": ("avif", "image/avif"),
+}
+
+
+def sniff_image_type(head):
+    """
+    Identifies an image format from the first bytes of the body, or None for non-images.
+    """
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return "avif"
+    return None
+
+LOGOLIKE_KEYWORDS = ["logo", "sprite", "icon", "banner", "header", "footer", "favicon", "gift", "giftcard"]
+
+
+def is_logolike(url):
+    return any(kw in url.lower() for kw in LOGOLIKE_KEYWORDS)
+
+
+class ImageDownload:
+    """
+    Result of a streamed image GET. `rejected` names why the body was dropped before or
+    while reading it (not_image, too_small, too_large); content is empty then.
+    """
+    def __init__(self, status_code, headers, content=b"", image_type=None, rejected=None):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.image_type = image_type
+        self.rejected = rejected
+
+    @property
+    def ok(self):
+        return self.status_code == 200 and self.rejected is None
+
+
 class AssetProcessor:
     def __init__(self):
-        import os
-        import random
         # List of realistic user agents
         self.user_agents = [
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -15,18 +75,105 @@ class AssetProcessor:
         ]
         
         self.proxy_url = os.getenv("PROXY_URL")
-        # Initialize client without specific headers as we'll set them per request
         if self.proxy_url:
             print(f"DEBUG: AssetProcessor using proxy: {self.proxy_url}")
-            self.client = httpx.Client(timeout=30.0, verify=False, proxy=self.proxy_url)
-        else:
-            self.client = httpx.Client(timeout=30.0, verify=False)
+        # Created lazily inside the running event loop; headers are set per request
+        self.client = None
+        self._download_slots = None
+        self._host_slots = {}
+        # In-flight uploads by content digest, shared by concurrent downloads of the same bytes
+        self._digest_uploads = {}
+        self.download_stats = {"downloads": 0, "bytes_downloaded": 0, "bytes_saved": 0, "rejected": {}}
+
+    def _get_client(self):
+        if self.client is None:
+            limits = httpx.Limits(
+                max_connections=IMAGE_DOWNLOAD_CONCURRENCY * 2,
+                max_keepalive_connections=IMAGE_DOWNLOAD_CONCURRENCY
+            )
+            kwargs = {"timeout": 30.0, "verify": False, "limits": limits}
+            if self.proxy_url:
+                kwargs["proxy"] = self.proxy_url
+            self.client = httpx.AsyncClient(**kwargs)
+        return self.client
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def _download(self, url):
+        """
+        GET an image within the global and per-host concurrency limits.
+        """
+        if self._download_slots is None:
+            self._download_slots = asyncio.Semaphore(IMAGE_DOWNLOAD_CONCURRENCY)
+        host = urlparse(url).netloc.lower()
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(IMAGE_HOST_CONCURRENCY)
+        async with self._host_slots[host], self._download_slots:
+            # Use rotating stealth headers for each request
+            async with self._get_client().stream("GET", url, timeout=10.0, headers=self._get_headers(url)) as response:
+                return await self._read_image(response)
+
+    async def _read_image(self, response):
+        """
+        Reads a streamed response only while it still looks like a usable image: error statuses,
+        non-image Content-Types and out-of-range Content-Lengths are dropped before the body,
+        and the magic bytes and size cap are checked as chunks arrive.
+        Leaving the stream context early closes the connection, so the rest is never transferred.
+        """
+        self.download_stats["downloads"] += 1
+        try:
+            declared = int(response.headers.get("Content-Length") or 0)
+        except ValueError:
+            declared = 0
+
+        def drop(received, rejected=None):
+            # Whatever the server announced but we never pulled through the proxy
+            self.download_stats["bytes_downloaded"] += received
+            self.download_stats["bytes_saved"] += max(0, declared - received)
+            if rejected:
+                counts = self.download_stats["rejected"]
+                counts[rejected] = counts.get(rejected, 0) + 1
+            return ImageDownload(response.status_code, response.headers, rejected=rejected)
+
+        if response.status_code != 200:
+            return drop(0)
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if not content_type.startswith("image/") and content_type not in GENERIC_CONTENT_TYPES:
+            return drop(0, "not_image")
+        if declared and declared < IMAGE_MIN_BYTES:
+            return drop(0, "too_small")
+        if declared > IMAGE_MAX_BYTES:
+            return drop(0, "too_large")
+
+        chunks = []
+        received = 0
+        image_type = None
+        async for chunk in response.aiter_bytes():
+            chunks.append(chunk)
+            received += len(chunk)
+            if image_type is None and received >= 12:
+                image_type = sniff_image_type(b"".join(chunks)[:12])
+                if image_type is None:
+                    return drop(received, "not_image")
+            if received > IMAGE_MAX_BYTES:
+                return drop(received, "too_large")
+
+        if received < IMAGE_MIN_BYTES:
+            return drop(received, "too_small")
+        self.download_stats["bytes_downloaded"] += received
+        return ImageDownload(response.status_code, response.headers, b"".join(chunks), image_type)
+
+    def stats(self):
+        return {**self.download_stats, "rejected": dict(self.download_stats["rejected"])}
+
     def _get_headers(self, url=None):
         import random
         ua = random.choice(self.user_agents)
         domain = "www.google.com"
         if url:
-             from urllib.parse import urlparse
              domain = urlparse(url).netloc
         
         return {
@@ -42,117 +189,181 @@ class AssetProcessor:
             "Sec-Fetch-Site": "same-site",
             "Upgrade-Insecure-Requests": "1"
         }
-    def process_product_images(self, products, category="products", subcategory="general"):
+    async def process_product_images(self, products):
         """
-        Iterates through products, downloads images from external URLs,
-        uploads them to S3, and updates the product metadata with S3 URLs.
+        Downloads product images from external URLs in parallel, uploads them to S3,
+        and updates the product metadata with S3 URLs. Keeps the input order.
         """
-        processed_products = []
-        for product in products:
-            image_url = product.get("image_url")
-            if image_url:
-                # Save as fallback before any modifications
-                if "original_image_url" not in product:
-                    product["original_image_url"] = image_url
-                
-                # Normalize the URL before processing
-                image_url = kimi_service._normalize_url(image_url)
-                
-                # 1. AWS/Amazon Thumbnail Cleaning - Aggressive Recovery
-                if "m.media-amazon.com" in image_url and "._" in image_url:
-                    import re
-                    # Remove all thumbnail tags like ._AC_SY200_., ._SX450_., etc.
-                    # Pattern matches everything between ._ and the file extension dot
-                    recovered_url = re.sub(r'\._[^/]*\.', '.', image_url)
-                    if recovered_url != image_url:
-                        print(f"DEBUG: Recovered high-res Amazon image: {recovered_url}")
-                        image_url = recovered_url
-                
-                # 2. Ajio Domain Repair - assets.ajio.com is often blocked/404
-                # assets-jiocdn.ajio.com is the persistent production CDN
-                if "assets.ajio.com" in image_url:
-                    image_url = image_url.replace("assets.ajio.com", "assets-jiocdn.ajio.com")
-                    print(f"DEBUG: Repaired Ajio URL: {image_url}")
-                
-                product["image_url"] = image_url
-                
-                # Strict Filtering: Only process actual image files
-                clean_url = image_url.split('?')[0].lower()
-                is_image = any(clean_url.endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.webp', '.gif', '.avif'])
-                
-                # Filter out obvious logos/sprites based on URL
-                logolike_keywords = ["logo", "sprite", "icon", "banner", "header", "footer", "favicon", "gift", "giftcard"]
-                is_logolike = any(kw in image_url.lower() for kw in logolike_keywords)
-                
-                from image_cache import image_cache
-                
-                # Check cache before doing any network requests
-                cached_s3 = image_cache.get_s3_url(image_url)
-                if cached_s3:
-                    print(f"INFO: IMAGE CACHE HIT. Skipping download for {image_url}")
-                    product["s3_image_url"] = cached_s3
-                    product["original_image_url"] = image_url
-                    processed_products.append(product)
-                    continue
-
-                if image_url.startswith("http") and is_image and not is_logolike:
-                    try:
-                        print(f"INFO: Attempting to download image: {image_url}")
-                        # Use rotating stealth headers for each request
-                        headers = self._get_headers(image_url)
-                        response = self.client.get(image_url, timeout=10.0, headers=headers)
+        from image_cache import image_cache
+
+        image_urls = [self._normalize_image_url(p) for p in products]
+        # One pass over the cache, failures and host stats for the whole batch instead of per image
+        cached, failures, blocked_hosts = await image_cache.alookup_many(image_urls)
+        results = await asyncio.gather(*(
+            self._process_product(
+                p, cached.get(url), failures.get(url),
+                bool(url) and urlparse(url).netloc.lower() in blocked_hosts
+            )
+            for p, url in zip(products, image_urls)
+        ))
+        return [p for p in results if p is not None]
+
+    def _normalize_image_url(self, product):
+        """
+        Repairs a product's image URL in place (normalization, Amazon thumbnails, Ajio CDN)
+        and returns it, or None when the product has no image.
+        """
+        image_url = product.get("image_url")
+        if not image_url:
+            return None
+        # Save as fallback before any modifications
+        if "original_image_url" not in product:
+            product["original_image_url"] = image_url
+
+        # Normalize the URL before processing
+        image_url = kimi_service._normalize_url(image_url)
+        
+        # 1. AWS/Amazon Thumbnail Cleaning - Aggressive Recovery
+        if "m.media-amazon.com" in image_url and "._" in image_url:
+            import re
+            # Remove all thumbnail tags like ._AC_SY200_., ._SX450_., etc.
+            # Pattern matches everything between ._ and the file extension dot
+            recovered_url = re.sub(r'\._[^/]*\.', '.', image_url)
+            if recovered_url != image_url:
+                print(f"DEBUG: Recovered high-res Amazon image: {recovered_url}")
+                image_url = recovered_url
+        
+        # 2. Ajio Domain Repair - assets.ajio.com is often blocked/404
+        # assets-jiocdn.ajio.com is the persistent production CDN
+        if "assets.ajio.com" in image_url:
+            image_url = image_url.replace("assets.ajio.com", "assets-jiocdn.ajio.com")
+            print(f"DEBUG: Repaired Ajio URL: {image_url}")
+        
+        product["image_url"] = image_url
+        return image_url
+
+    async def _process_product(self, product, cached_s3=None, failure=None, host_blocked=False):
+        """
+        Mirrors one product's image. Returns the product, or None when its image is a tiny pixel.
+        """
+        image_url = product.get("image_url")
+        if image_url:
+            # No extension check: CDN image URLs often have none, and the streamed
+            # download sniffs the magic bytes before keeping anything
+            from image_cache import image_cache, failure_reason
+            
+            # Cache, failures and host stats were checked for the whole batch before any network requests
+            if cached_s3:
+                print(f"INFO: IMAGE CACHE HIT. Skipping download for {image_url}")
+                product["s3_image_url"] = cached_s3
+                product["original_image_url"] = image_url
+                return product
+
+            # Known-bad URLs and hotlink-blocking hosts are not refetched until their backoff expires
+            if failure:
+                print(f"SKIP: Image failed recently ({failure}), not retrying yet: {image_url}")
+                return None if failure == "too_small" else product
+            if host_blocked:
+                print(f"SKIP: Image host keeps failing, skipping: {image_url}")
+                return product
+
+            # Filter out obvious logos/sprites based on URL
+            if image_url.startswith("http") and not is_logolike(image_url):
+                requested_url = image_url
+                try:
+                    print(f"INFO: Attempting to download image: {image_url}")
+                    download = await self._download(image_url)
+                    
+                    # SIZE FILTER: Skip images under 1KB (likely tiny invisible pixels)
+                    if download.rejected == "too_small":
+                        print(f"SKIP: Image too small, likely a logo or icon: {image_url}")
+                        await image_cache.arecord_failure(image_url, "too_small")
+                        return None
+                    print(f"INFO: Image download status: {download.status_code} ({len(download.content)} bytes)"
+                          + (f", rejected: {download.rejected}" if download.rejected else ""))
+                    
+                    if not download.ok and product.get("original_image_url", image_url) != image_url:
+                         # Don't split on '?' for Shopify URLs as they might need v=...
+                         image_url = product["original_image_url"]
+                         print(f"WARNING: Initial URL failed ({download.rejected or download.status_code}). Retrying with original: {image_url}")
+                         download = await self._download(image_url)
+                         print(f"INFO: Original image download status: {download.status_code}")
+                    if download.ok:
+                        # The sniffed format beats the URL extension and the server's Content-Type
+                        ext, content_type = IMAGE_FORMATS[download.image_type]
                         
-                        # SIZE FILTER: Skip images under 1KB (likely tiny invisible pixels)
-                        content_len = len(response.content)
-                        if response.status_code == 200 and content_len < 1000:
-                            print(f"SKIP: Image too small ({content_len} bytes), likely a logo or icon: {image_url}")
-                            continue
-                        print(f"INFO: Image download status: {response.status_code} ({content_len} bytes)")
+                        s3_url = await self._store_content_addressed(download.content, ext, content_type)
                         
-                        if response.status_code != 200 and "original_image_url" in product:
-                             # Don't split on '?' for Shopify URLs as they might need v=...
-                             image_url = product["original_image_url"]
-                             print(f"WARNING: Initial URL failed ({response.status_code}). Retrying with original: {image_url}")
-                             headers = self._get_headers(image_url)
-                             response = self.client.get(image_url, timeout=10.0, headers=headers)
-                             print(f"INFO: Original image download status: {response.status_code}")
-                        if response.status_code == 200:
-                            # Generate a unique file name with category structure
-                            ext = image_url.split(".")[-1].split("?")[0]
-                            if len(ext) > 4: ext = "jpg" # Fallback
-                            
-                            # Use categorized structure for S3
-                            filename = f"products/{category}/{subcategory}/{uuid.uuid4()}.{ext}"
-                            
-                            # Upload to S3
-                            s3_url = s3_service.upload_image(
-                                response.content, 
-                                filename,
-                                content_type=response.headers.get("Content-Type", "image/jpeg")
-                            )
-                            
-                            if s3_url:
-                                product["s3_image_url"] = s3_url
-                                # Keep original as backup or reference
-                                product["original_image_url"] = image_url
-                                # Save to DB Cache
-                                image_cache.save_s3_url(image_url, s3_url)
-                            else:
-                                print(f"WARNING: S3 upload failed for {image_url}")
+                        await image_cache.arecord_success(requested_url)
+                        if s3_url:
+                            product["s3_image_url"] = s3_url
+                            # Keep original as backup or reference
+                            product["original_image_url"] = image_url
+                            # Every URL alias that led to these bytes points at the same object
+                            await image_cache.aput_many({image_url: s3_url, requested_url: s3_url})
                         else:
-                            print(f"WARNING: All download attempts failed for {image_url}")
-                    except httpx.ConnectError as e:
-                        print(f"ERROR: DNS/Connection failure for {image_url}: {e}")
-                    except Exception as e:
-                        print(f"ERROR: Failed to process image {image_url}: {e}")
-                        import traceback
-                        traceback.print_exc()
-            
-            processed_products.append(product)
+                            print(f"WARNING: S3 upload failed for {image_url}")
+                    else:
+                        print(f"WARNING: All download attempts failed for {image_url}")
+                        await image_cache.arecord_failure(
+                            requested_url, download.rejected or failure_reason(download.status_code)
+                        )
+                except httpx.TimeoutException as e:
+                    print(f"ERROR: Image download timed out for {image_url}: {e}")
+                    await image_cache.arecord_failure(requested_url, "timeout")
+                except httpx.ConnectError as e:
+                    print(f"ERROR: DNS/Connection failure for {image_url}: {e}")
+                    await image_cache.arecord_failure(requested_url, "connect_error")
+                except httpx.TransportError as e:
+                    # Dropped connections and protocol errors, typical of hosts cutting off hotlinkers
+                    print(f"ERROR: Image download failed for {image_url}: {e}")
+                    await image_cache.arecord_failure(requested_url, "transport_error")
+                except Exception as e:
+                    print(f"ERROR: Failed to process image {image_url}: {e}")
+                    import traceback
+                    traceback.print_exc()
         
-        return processed_products
-        
-    async def process_raw_content(self, content, category="uncategorized", subcategory="general"):
+        return product
+
+    async def _store_content_addressed(self, content, ext, content_type):
+        """
+        Stores image bytes under a key derived from their SHA-256, so the same photo reached
+        through different URLs (CDN resizes, query strings) is uploaded only once.
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        # Concurrent downloads of the same bytes wait for one upload instead of racing
+        task = self._digest_uploads.get(digest)
+        if task is None:
+            task = asyncio.create_task(self._upload_by_digest(digest, content, ext, content_type))
+            self._digest_uploads[digest] = task
+
+            def finished(done):
+                if self._digest_uploads.get(digest) is done:
+                    del self._digest_uploads[digest]
+
+            task.add_done_callback(finished)
+        # Shielded so one download being cancelled does not cancel the upload for the others
+        return await asyncio.shield(task)
+
+    async def _upload_by_digest(self, digest, content, ext, content_type):
+        from image_cache import image_cache
+
+        s3_url = await image_cache.aget_s3_url_by_digest(digest)
+        if s3_url:
+            print(f"INFO: Image bytes already stored as {digest[:12]}, skipping upload")
+            return s3_url
+
+        filename = f"images/{digest[:2]}/{digest}.{ext.lower()}"
+        # boto3 is blocking, so keep it off the event loop
+        if await asyncio.to_thread(s3_service.object_exists, filename):
+            s3_url = s3_service.public_url(filename)
+        else:
+            s3_url = await asyncio.to_thread(s3_service.upload_image, content, filename, content_type=content_type)
+        if s3_url:
+            await image_cache.asave_digest(digest, s3_url, len(content))
+        return s3_url
+
+    async def process_raw_content(self, content):
         """
         Scans raw markdown for images, uploads them to S3, and returns cleaned content and first S3 image.
         """
@@ -167,22 +378,26 @@ class AssetProcessor:
             return content, None
             
         first_s3_url = None
+        pending = []
         for url in all_urls:
             # Skip if already an S3 URL
             if "amazonaws.com" in url:
                 if not first_s3_url: first_s3_url = url
                 continue
-                
-            try:
-                # Prepare a mini-product for existing logic
-                mini_products = [{"image_url": url}]
-                processed = self.process_product_images(mini_products, category, subcategory)
-                if processed and processed[0].get("s3_image_url"):
-                    s3_url = processed[0]["s3_image_url"]
-                    content = content.replace(url, s3_url)
-                    if not first_s3_url: first_s3_url = s3_url
-            except Exception:
-                continue
+            pending.append(url)
+
+        # Mirror every image of the page at once via the product pipeline
+        mini_products = [{"image_url": url} for url in pending]
+        try:
+            # Products are updated in place, so results are read back from mini_products
+            await self.process_product_images(mini_products)
+        except Exception:
+            pass
+        for url, p in zip(pending, mini_products):
+            s3_url = p.get("s3_image_url")
+            if s3_url:
+                content = content.replace(url, s3_url)
+                if not first_s3_url: first_s3_url = s3_url
                 
         return content, first_s3_url
 asset_processor = AssetProcessor()
@@ -4,6 +4,9 @@ from langchain.prompts import PromptTemplate
 import os
 import asyncio
 from dotenv import load_dotenv
+from rate_limiter import llm_limiter, FOREGROUND
+from content_condenser import estimate_tokens
+from context_builder import build_context
 
 load_dotenv()
 
@@ -14,9 +17,9 @@ def get_llm():
         temperature=0
     )
 
-async def chat_with_bot(query: str, discovered_stores: list = None, live_context: list = None, intent_type: str = "shopping", local_docs: list = None):
+async def build_prompt(query: str, live_context: list = None, intent_type: str = "shopping", local_docs: list = None):
     """
-    Sends a query to the chatbot asynchronously and returns the response.
+    Builds the assistant prompt from live products and RAG documents.
     """
     if local_docs is None:
         retriever = get_cached_retriever()
@@ -24,55 +27,12 @@ async def chat_with_bot(query: str, discovered_stores: list = None, live_context
         loop = asyncio.get_event_loop()
         docs = await loop.run_in_executor(None, retriever._get_relevant_documents, query)
     else:
-        docs = [d[0] if isinstance(d, tuple) else d for d in local_docs]
-    
-    rag_items = []
-    seen_products = set()
-    
-    for doc in docs:
-        img = doc.metadata.get("image_url") or doc.metadata.get("s3_image_url") or doc.metadata.get("Image URL")
-        
-        if not img:
-            import re
-            markdown_imgs = re.findall(r'!\[.*?\]\((.*?)\)', doc.page_content)
-            html_imgs = re.findall(r'<img.*?src=["\'](.*?)["\']', doc.page_content, flags=re.IGNORECASE)
-            all_content_imgs = markdown_imgs + html_imgs
-            if all_content_imgs:
-                for u in all_content_imgs:
-                    if "logo" not in u.lower() and "icon" not in u.lower():
-                        img = u
-                        break
-                if not img: img = all_content_imgs[0]
-
-        src = doc.metadata.get("source") or doc.metadata.get("source_url") or doc.metadata.get("Source URL")
-        name = doc.metadata.get("name") or doc.metadata.get("Product Name") or ""
-        
-        product_key = (src, name)
-        if product_key in seen_products:
-            continue
-        seen_products.add(product_key)
-        
-        item = f"CONTENT: {doc.page_content}"
-        if img: item += f"\nIMAGE_URL: {img}"
-        if src: item += f"\nSOURCE_URL: {src}"
-        rag_items.append(item)
-        
-    rag_context = "\n\n---\n\n".join(rag_items)
-    
-    live_context_str = ""
-    if live_context:
-        live_items = []
-        for p in live_context:
-            live_items.append(
-                f"LIVE_PRODUCT: {p.get('name')}\n"
-                f"Brand: {p.get('brand')}\n"
-                f"Price: {p.get('price')} {p.get('currency', '')}\n"
-                f"IMAGE_URL: {p.get('image_url')}\n"
-                f"SOURCE_URL: {p.get('url') or p.get('source_url')}"
-            )
-        live_context_str = "\n\n".join(live_items)
+        # Keep (doc, score) pairs so the context builder can rank by relevance
+        docs = local_docs
     
-    context = f"{live_context_str}\n\n{rag_context}".strip()
+    context, stats = build_context(query, docs, live_products=live_context)
+    print(f"📏 Context: {stats['items']}/{stats['candidates']} items, {stats['duplicates']} duplicates dropped, "
+          f"{stats['over_budget']} over budget, {stats['context_tokens']} tokens")
     
     if intent_type == "shopping":
         has_images = "IMAGE_URL" in context
@@ -98,16 +58,54 @@ async def chat_with_bot(query: str, discovered_stores: list = None, live_context
         Answer:"""
     
     prompt = template.format(context=context, question=query)
-    llm = get_llm()
-    response = await llm.ainvoke(prompt)
-    content = response.content
-    
+    print(f"📏 Prompt tokens: ~{estimate_tokens(prompt)}")
+    return prompt
+
+
+def clean_urls(content):
     # Simple URL cleaning
-    content = content.replace("https://https://", "https://").replace("https://http://", "https://")
+    return content.replace("https://https://", "https://").replace("https://http://", "https://")
+
+
+def empty_response(intent_type):
+    if intent_type == "shopping":
+        return "I couldn't find any specific products matching your query at the moment. Please try searching for something else or let me know if you need help with anything else!"
+    return "I'm sorry, I couldn't find any information on that. Could you please rephrase your question?"
+
+
+async def chat_with_bot(query: str, discovered_stores: list = None, live_context: list = None, intent_type: str = "shopping", local_docs: list = None):
+    """
+    Sends a query to the chatbot asynchronously and returns the response.
+    """
+    prompt = await build_prompt(query, live_context=live_context, intent_type=intent_type, local_docs=local_docs)
+    llm = get_llm()
+    # Shares the LLM budget with background extraction, but always goes first
+    async with llm_limiter.slot(FOREGROUND, tokens=estimate_tokens(prompt) + 1024) as lease:
+        response = await llm.ainvoke(prompt)
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            lease.tokens = usage.get("total_tokens", lease.tokens)
+    content = clean_urls(response.content)
     
     if not content.strip():
-        if intent_type == "shopping":
-            return "I couldn't find any specific products matching your query at the moment. Please try searching for something else or let me know if you need help with anything else!"
-        return "I'm sorry, I couldn't find any information on that. Could you please rephrase your question?"
+        return empty_response(intent_type)
         
     return content
+
+
+async def stream_chat_with_bot(query: str, live_context: list = None, intent_type: str = "shopping", local_docs: list = None):
+    """
+    Same as chat_with_bot, but yields the completion text chunk by chunk as it is generated.
+    """
+    prompt = await build_prompt(query, live_context=live_context, intent_type=intent_type, local_docs=local_docs)
+    llm = get_llm()
+    async with llm_limiter.slot(FOREGROUND, tokens=estimate_tokens(prompt) + 1024) as lease:
+        produced = 0
+        async for chunk in llm.astream(prompt):
+            text = chunk.content if isinstance(chunk.content, str) else "".join(
+                part.get("text", "") for part in chunk.content if isinstance(part, dict)
+            )
+            produced += len(text)
+            if text:
+                yield text
+        lease.tokens = estimate_tokens(prompt) + produced // 4
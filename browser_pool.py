@@ -0,0 +1,187 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from crawl4ai import AsyncWebCrawler, BrowserConfig
+from crawl_profiles import get_crawl_profile, make_blocking_hook, blocked_stats
+
+
+def get_browser_config():
+    """
+    Shared headless Chromium configuration used by every pooled browser.
+    """
+    proxy_url = os.getenv("PROXY_URL")
+    return BrowserConfig(
+        headless=True,
+        extra_args=["--disable-gpu", "--disable-dev-shm-usage"],
+        proxy=proxy_url if proxy_url else None
+    )
+
+
+class _PooledBrowser:
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.active = 0
+        self.uses = 0
+        self.consecutive_failures = 0
+        self.retiring = False
+
+
+class BrowserPool:
+    """
+    Process-wide pool of warm Chromium instances.
+    Each lease borrows a browser for one task; crawl4ai opens a fresh page per arun,
+    so concurrent leases on the same browser stay isolated from each other.
+    Browsers are recycled after `max_uses` leases or when they crash.
+    """
+    def __init__(self, size=None, pages_per_browser=None, max_uses=None, max_failures=3, profile=None):
+        cpu_count = os.cpu_count() or 2
+        self.size = size or int(os.getenv("BROWSER_POOL_SIZE", max(1, cpu_count // 2)))
+        self.pages_per_browser = pages_per_browser or int(os.getenv("BROWSER_POOL_PAGES", 4))
+        self.max_uses = max_uses or int(os.getenv("BROWSER_POOL_MAX_USES", 200))
+        self.max_failures = max_failures
+        self.profile = profile or get_crawl_profile()
+        self._browsers = []
+        # Replacement browsers being launched; they count towards `size`
+        self._launching = 0
+        self._condition = None
+        self._start_lock = None
+        self._started = False
+
+    async def start(self):
+        if self._started:
+            return
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._started:
+                return
+            self._condition = asyncio.Condition()
+            try:
+                for _ in range(self.size):
+                    self._browsers.append(await self._launch())
+            except BaseException:
+                # Don't leak the browsers that did launch; the next start() retries from scratch
+                browsers, self._browsers = self._browsers, []
+                for pooled in browsers:
+                    await self._shutdown(pooled)
+                raise
+            self._started = True
+            print(f"DEBUG: Browser pool started ({self.size} browsers x {self.pages_per_browser} pages, '{self.profile}' profile)")
+
+    async def close(self):
+        if not self._started:
+            return
+        browsers, self._browsers = self._browsers, []
+        self._started = False
+        for pooled in browsers:
+            await self._shutdown(pooled)
+        print("DEBUG: Browser pool closed")
+
+    async def _launch(self):
+        crawler = AsyncWebCrawler(config=get_browser_config())
+        if self.profile != "full":
+            # Block images, media, fonts and trackers; we only keep markdown and image URLs
+            crawler.crawler_strategy.set_hook("on_page_context_created", make_blocking_hook(self.profile))
+        await crawler.start()
+        return _PooledBrowser(crawler)
+
+    async def _shutdown(self, pooled):
+        try:
+            await pooled.crawler.close()
+        except Exception as e:
+            # A crashed browser can fail to close cleanly; it is being discarded anyway
+            print(f"DEBUG: Ignoring error while closing pooled browser: {e}")
+
+    def _pick(self):
+        candidates = [b for b in self._browsers if not b.retiring and b.active < self.pages_per_browser]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda b: b.active)
+
+    async def _recycle(self, pooled):
+        if pooled in self._browsers:
+            self._browsers.remove(pooled)
+        await self._shutdown(pooled)
+        if self._started:
+            self._launching += 1
+            try:
+                self._browsers.append(await self._launch())
+            except Exception as e:
+                # lease() relaunches the missing browser the next time it is needed
+                print(f"ERROR: Could not relaunch pooled browser: {e}")
+            finally:
+                self._launching -= 1
+        async with self._condition:
+            self._condition.notify_all()
+
+    @asynccontextmanager
+    async def lease(self):
+        """
+        Borrows a warm crawler for the duration of the block.
+        An exception escaping the block marks the browser as crashed.
+        """
+        await self.start()
+        while True:
+            async with self._condition:
+                pooled = self._pick()
+                # Only wait while the pool is at full strength; otherwise nothing would wake us
+                while pooled is None and len(self._browsers) + self._launching >= self.size:
+                    await self._condition.wait()
+                    pooled = self._pick()
+                if pooled is not None:
+                    pooled.active += 1
+                    pooled.uses += 1
+                    break
+                self._launching += 1
+            # A relaunch failed earlier: replace the browser now. A launch error reaches the caller.
+            replacement = None
+            try:
+                replacement = await self._launch()
+            finally:
+                async with self._condition:
+                    self._launching -= 1
+                    if replacement is not None:
+                        self._browsers.append(replacement)
+                    # On failure, other waiters retry the launch themselves
+                    self._condition.notify_all()
+
+        crashed = False
+        try:
+            yield pooled.crawler
+        except Exception:
+            crashed = True
+            raise
+        finally:
+            pooled.active -= 1
+            if crashed or pooled.consecutive_failures >= self.max_failures:
+                print("DEBUG: Pooled browser crashed or keeps failing, recycling...")
+                pooled.retiring = True
+            elif pooled.uses >= self.max_uses:
+                pooled.retiring = True
+            if pooled.retiring and pooled.active == 0:
+                await self._recycle(pooled)
+            else:
+                async with self._condition:
+                    self._condition.notify_all()
+
+    def report_result(self, crawler, success):
+        """
+        Records the outcome of a crawl so repeatedly failing browsers get recycled.
+        """
+        for pooled in self._browsers:
+            if pooled.crawler is crawler:
+                pooled.consecutive_failures = 0 if success else pooled.consecutive_failures + 1
+                return
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "pages_per_browser": self.pages_per_browser,
+            "active_leases": sum(b.active for b in self._browsers),
+            "uses": [b.uses for b in self._browsers],
+            "profile": self.profile,
+            "requests": dict(blocked_stats),
+        }
+
+
+browser_pool = BrowserPool()
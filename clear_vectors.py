@@ -23,5 +23,9 @@ def clear_vector_store():
     )
     print("Empty vector store ready.")
 
+    # Otherwise conditional fetches keep reporting 'unchanged' and nothing is re-ingested
+    from page_state import page_state
+    page_state.clear()
+
 if __name__ == "__main__":
     clear_vector_store()
@@ -0,0 +1,117 @@
+import os
+import re
+
+# Default extraction budget, roughly the old 15,000-character cut
+DEFAULT_TOKEN_BUDGET = int(os.getenv("EXTRACTION_TOKEN_BUDGET", 3750))
+MAX_BLOCK_CHARS = 1500
+
+PRICE_RE = re.compile(
+    r"(?:[$€£₹¥]|\brs\.?|\binr\b|\busd\b|\beur\b|\bgbp\b)\s?\d[\d,]*(?:\.\d{1,2})?"
+    r"|\d[\d,]*(?:\.\d{1,2})?\s?(?:[$€£₹]|\busd\b|\beur\b|\binr\b)",
+    re.IGNORECASE
+)
+IMAGE_RE = re.compile(r"!\[[^\]]*\]\([^)]+\)")
+LINK_RE = re.compile(r"(?<!!)\[([^\]]*)\]\([^)]+\)")
+PRODUCT_WORDS_RE = re.compile(
+    r"add to (?:cart|bag|basket)|buy now|in stock|out of stock|\bsku\b|\bmrp\b|rating|reviews?|"
+    r"\bsizes?\b|\bcolou?rs?\b|% off|discount|free delivery",
+    re.IGNORECASE
+)
+BOILERPLATE_RE = re.compile(
+    r"cookie|privacy policy|terms (?:of|and) (?:use|service|conditions)|newsletter|subscribe|"
+    r"sign in|log ?in|create (?:an )?account|all rights reserved|copyright|©|follow us|"
+    r"download (?:the|our) app|skip to (?:main )?content|customer (?:service|care)|track (?:your )?order",
+    re.IGNORECASE
+)
+
+
+def estimate_tokens(text):
+    """
+    Rough token count (~4 characters per token), good enough for budgeting prompts.
+    """
+    return len(text or "") // 4
+
+
+def _split_blocks(markdown):
+    blocks = []
+    for block in re.split(r"\n\s*\n", markdown):
+        block = block.strip()
+        if not block:
+            continue
+        if len(block) <= MAX_BLOCK_CHARS:
+            blocks.append(block)
+            continue
+        # Pages without blank lines would otherwise be one giant block; regroup by lines
+        current = []
+        size = 0
+        for line in block.splitlines():
+            if size + len(line) > MAX_BLOCK_CHARS and current:
+                blocks.append("\n".join(current))
+                current, size = [], 0
+            current.append(line)
+            size += len(line) + 1
+        if current:
+            blocks.append("\n".join(current))
+    return blocks
+
+
+def _score_block(block):
+    """
+    Positive for product-like regions (prices, images, cart words), None for boilerplate.
+    """
+    prices = len(PRICE_RE.findall(block))
+    images = len(IMAGE_RE.findall(block))
+    product_words = len(PRODUCT_WORDS_RE.findall(block))
+    if not prices and not images:
+        link_text = sum(len(m) for m in LINK_RE.findall(block))
+        plain = LINK_RE.sub("", block)
+        # Menus and footers: mostly links, or short blocks of legal/account chrome
+        if link_text and len(re.sub(r"[\s|*\-•>#]", "", plain)) < link_text * 0.4:
+            return None
+        if len(block) < 400 and BOILERPLATE_RE.search(block):
+            return None
+    score = 3 * prices + 2 * images + product_words
+    if block.startswith("#"):
+        score += 1
+    return score
+
+
+def condense(markdown, token_budget=None):
+    """
+    Shrinks page markdown for LLM extraction: drops navigation, footers and banners,
+    removes repeated blocks, then keeps the most product-like blocks (in page order)
+    that fit the token budget. Falls back to the start of the raw markdown when every
+    block was filtered out.
+    """
+    if not markdown:
+        return ""
+    token_budget = token_budget or DEFAULT_TOKEN_BUDGET
+
+    candidates = []
+    seen = set()
+    for index, block in enumerate(_split_blocks(markdown)):
+        key = re.sub(r"\s+", " ", block).lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        score = _score_block(block)
+        if score is not None:
+            candidates.append((index, block, score))
+
+    # Highest-scoring blocks first; ties keep page order so the title/intro survive
+    remaining = token_budget
+    kept = []
+    for index, block, score in sorted(candidates, key=lambda c: (-c[2], c[0])):
+        tokens = estimate_tokens(block) + 1
+        if tokens <= remaining:
+            kept.append((index, block))
+            remaining -= tokens
+        elif not kept:
+            kept.append((index, block[:remaining * 4]))
+            remaining = 0
+        if remaining <= 0:
+            break
+    if not kept:
+        # Everything looked like boilerplate; the raw head of the page beats an empty prompt
+        return markdown.strip()[:token_budget * 4]
+    return "\n\n".join(block for _, block in sorted(kept))
@@ -0,0 +1,131 @@
+import os
+import re
+from content_condenser import estimate_tokens
+
+# Prompt context budget for chat answers (live products + RAG chunks)
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", 2500))
+# Raw page chunks longer than this are cut; product facts live in the compact line anyway
+MAX_CHUNK_CHARS = 700
+# Word-shingle overlap above which two chunks count as the same text
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+
+def _shingles(text, size=3):
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _is_near_duplicate(shingles, kept):
+    for other in kept:
+        union = len(shingles | other)
+        if union and len(shingles & other) / union >= NEAR_DUPLICATE_THRESHOLD:
+            return True
+    return False
+
+
+def _content_image(text):
+    markdown_imgs = re.findall(r'!\[.*?\]\((.*?)\)', text)
+    html_imgs = re.findall(r'<img.*?src=["\'](.*?)["\']', text, flags=re.IGNORECASE)
+    all_content_imgs = markdown_imgs + html_imgs
+    for u in all_content_imgs:
+        if "logo" not in u.lower() and "icon" not in u.lower():
+            return u
+    return all_content_imgs[0] if all_content_imgs else None
+
+
+def product_line(label, name, brand=None, price=None, currency=None, image_url=None, source_url=None, details=None):
+    """
+    One compact line per product; IMAGE_URL/SOURCE_URL keep the markers the prompt relies on.
+    """
+    parts = [f"{label}: {name}"]
+    if brand:
+        parts.append(f"Brand: {brand}")
+    if price:
+        parts.append(f"Price: {price} {currency or ''}".strip())
+    if details:
+        parts.append(f"Details: {str(details)[:160]}")
+    if image_url:
+        parts.append(f"IMAGE_URL: {image_url}")
+    if source_url:
+        parts.append(f"SOURCE_URL: {source_url}")
+    return " | ".join(parts)
+
+
+def _doc_item(doc, rank, total, score, query_words):
+    meta = doc.metadata
+    img = meta.get("image_url") or meta.get("s3_image_url") or meta.get("Image URL") or _content_image(doc.page_content)
+    src = meta.get("source") or meta.get("source_url") or meta.get("Source URL")
+    name = meta.get("name") or meta.get("Product Name") or ""
+
+    if name and (meta.get("price") or img):
+        text = product_line("PRODUCT", name, meta.get("brand"), meta.get("price"), meta.get("currency"),
+                            img, src, meta.get("details"))
+        product_bonus = 0.5 + (0.3 if img else 0)
+    else:
+        text = f"CONTENT: {doc.page_content[:MAX_CHUNK_CHARS]}"
+        if img: text += f"\nIMAGE_URL: {img}"
+        if src: text += f"\nSOURCE_URL: {src}"
+        product_bonus = 0.3 if img else 0
+
+    # Chroma distances: lower is closer. Without scores, fall back to retrieval order.
+    relevance = 1 / (1 + score) if score is not None else 1 - rank / max(total, 1)
+    lowered = doc.page_content.lower() + " " + name.lower()
+    overlap = sum(1 for w in query_words if w in lowered) / len(query_words) if query_words else 0
+    return {
+        "key": (src, name),
+        "text": text,
+        "dedupe_text": doc.page_content,
+        "score": relevance + product_bonus + overlap,
+    }
+
+
+def build_context(query, docs, live_products=None, token_budget=None):
+    """
+    Packs live products and retrieved documents into a token-budgeted prompt context.
+    Near-identical chunks are dropped, the rest are ranked by relevance, query overlap and
+    product fields, and written highest-ranked first. Returns (context, stats).
+    """
+    token_budget = token_budget or CHAT_CONTEXT_TOKEN_BUDGET
+    query_words = [w for w in re.findall(r"[a-z0-9]+", query.lower()) if len(w) > 2]
+
+    items = []
+    for p in live_products or []:
+        # Fresh live results go first; they are already compact
+        text = product_line("LIVE_PRODUCT", p.get("name"), p.get("brand"), p.get("price"), p.get("currency"),
+                            p.get("image_url"), p.get("url") or p.get("source_url"))
+        items.append({"key": (p.get("url") or p.get("source_url"), p.get("name")), "text": text,
+                      "dedupe_text": text, "score": 2.0})
+
+    pairs = [d if isinstance(d, tuple) else (d, None) for d in docs or []]
+    for rank, (doc, score) in enumerate(pairs):
+        items.append(_doc_item(doc, rank, len(pairs), score, query_words))
+
+    stats = {"candidates": len(items), "duplicates": 0, "over_budget": 0}
+    seen_keys = set()
+    kept_shingles = []
+    unique = []
+    for item in items:
+        shingles = _shingles(item["dedupe_text"])
+        # Same named product from the same source, or the same text under another URL
+        if (item["key"][1] and item["key"] in seen_keys) or _is_near_duplicate(shingles, kept_shingles):
+            stats["duplicates"] += 1
+            continue
+        seen_keys.add(item["key"])
+        kept_shingles.append(shingles)
+        unique.append(item)
+
+    packed = []
+    used = 0
+    for item in sorted(unique, key=lambda i: -i["score"]):
+        tokens = estimate_tokens(item["text"]) + 1
+        if used + tokens > token_budget:
+            stats["over_budget"] += 1
+            continue
+        packed.append(item["text"])
+        used += tokens
+
+    stats["items"] = len(packed)
+    stats["context_tokens"] = used
+    return "\n\n".join(packed), stats
@@ -0,0 +1,87 @@
+import os
+import re
+from urllib.parse import urljoin, urlparse
+
+# Resource types (Playwright request.resource_type) each profile refuses to download
+CRAWL_PROFILES = {
+    "text": {"image", "media", "font"},
+    "full": set(),
+}
+
+TRACKER_DOMAINS = [
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "adservice.google.com", "facebook.net", "connect.facebook.net", "hotjar.com", "clarity.ms",
+    "bat.bing.com", "criteo.com", "criteo.net", "taboola.com", "outbrain.com", "amazon-adsystem.com",
+    "scorecardresearch.com", "nr-data.net", "cdn.segment.com", "api.segment.io", "analytics.tiktok.com",
+    "sc-static.net", "quantserve.com", "adnxs.com", "rubiconproject.com", "pubmatic.com", "moengage.com",
+    "clevertap-prod.com", "branch.io", "mixpanel.com", "fullstory.com",
+]
+
+_IMG_TAG_RE = re.compile(r"<img\b[^>]*>", re.IGNORECASE)
+_SOURCE_TAG_RE = re.compile(r"<source\b[^>]*>", re.IGNORECASE)
+_ATTR_RE = re.compile(r"""\b(src|data-src|data-original|data-lazy|srcset|data-srcset)\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+
+blocked_stats = {"blocked": 0, "allowed": 0}
+
+
+def get_crawl_profile():
+    profile = os.getenv("CRAWL_PROFILE", "text").lower()
+    return profile if profile in CRAWL_PROFILES else "text"
+
+
+def is_tracker(url):
+    host = urlparse(url).netloc.lower()
+    return any(host == d or host.endswith("." + d) for d in TRACKER_DOMAINS)
+
+
+def make_blocking_hook(profile):
+    """
+    Builds a crawl4ai on_page_context_created hook that aborts heavy resource types
+    and tracker requests at the network layer for the given profile.
+    """
+    blocked_types = CRAWL_PROFILES.get(profile, set())
+
+    async def on_page_context_created(page, context, **kwargs):
+        async def route_filter(route):
+            request = route.request
+            if request.resource_type in blocked_types or is_tracker(request.url):
+                blocked_stats["blocked"] += 1
+                await route.abort()
+            else:
+                blocked_stats["allowed"] += 1
+                await route.continue_()
+
+        # Per page: pooled browsers reuse one context across leases, so context-level
+        # routes would pile up and each would run on every request
+        await page.route("**/*", route_filter)
+        return page
+
+    return on_page_context_created
+
+
+def extract_image_urls(html, base_url):
+    """
+    Collects <img>/<source> src, lazy-load and srcset URLs from the page HTML,
+    so blocked images can still be fetched later by the asset pipeline.
+    """
+    if not html:
+        return []
+    urls = []
+    seen = set()
+    for tag in _IMG_TAG_RE.findall(html) + _SOURCE_TAG_RE.findall(html):
+        for attr, value in _ATTR_RE.findall(tag):
+            value = value.replace("&amp;", "&").strip()
+            if "srcset" in attr.lower():
+                # srcset: "url 1x, url 2x" / "url 480w, ..." - keep every candidate URL
+                # Split on ", " only, CDN URLs like Cloudinary use bare commas inside the path
+                candidates = [c.strip().split(" ")[0] for c in re.split(r",\s+", value) if c.strip()]
+            else:
+                candidates = [value]
+            for candidate in candidates:
+                if not candidate or candidate.startswith("data:"):
+                    continue
+                full_url = urljoin(base_url, candidate)
+                if full_url not in seen:
+                    seen.add(full_url)
+                    urls.append(full_url)
+    return urls
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+THROTTLE_STATUSES = {429, 503}
+CHALLENGE_MARKERS = re.compile(
+    r"captcha|are you a robot|access denied|just a moment\.\.\.|cf-chl|attention required|unusual traffic",
+    re.IGNORECASE
+)
+
+
+class _HostBucket:
+    """
+    Token bucket for one host. The refill rate shrinks on throttling and recovers additively.
+    """
+    def __init__(self, rate, burst, concurrency):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.strikes = 0
+        self.active = 0
+        self.max_active = concurrency
+        # Notified whenever a request on this host finishes
+        self.released = asyncio.Condition()
+
+    def has_capacity(self):
+        return self.active < self.max_active
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """
+        Seconds until this host's backoff and token bucket allow another request (0 for now).
+        """
+        self.refill()
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        return 0.0
+
+
+class CrawlScheduler:
+    """
+    Politeness scheduler shared by every crawl in the process.
+    A global cap bounds total in-flight fetches; each host gets its own token bucket and
+    concurrency limit, and backs off on 429/503 or challenge pages.
+    """
+    def __init__(self, max_concurrency=None, host_rate=None, host_burst=None, host_concurrency=None):
+        self.max_concurrency = max_concurrency or int(os.getenv("CRAWL_MAX_CONCURRENCY", 12))
+        self.host_rate = host_rate or float(os.getenv("CRAWL_HOST_RATE", 2.0))
+        self.host_burst = host_burst or int(os.getenv("CRAWL_HOST_BURST", 4))
+        self.host_concurrency = host_concurrency or int(os.getenv("CRAWL_HOST_CONCURRENCY", 4))
+        self._global = asyncio.Semaphore(self.max_concurrency)
+        self._hosts = {}
+
+    def _bucket(self, url):
+        host = urlparse(url).netloc.lower()
+        if host not in self._hosts:
+            self._hosts[host] = _HostBucket(self.host_rate, self.host_burst, self.host_concurrency)
+        return self._hosts[host]
+
+    @asynccontextmanager
+    async def slot(self, url):
+        """
+        Waits for the host's politeness budget and a global slot, then holds both for the block.
+        """
+        bucket = self._bucket(url)
+        while True:
+            if not bucket.has_capacity():
+                async with bucket.released:
+                    await bucket.released.wait_for(bucket.has_capacity)
+            delay = bucket.wait_time()
+            if delay <= 0 and bucket.has_capacity():
+                break
+            if delay > 0:
+                # Capped so a backoff shortened or extended by report() is picked up
+                await asyncio.sleep(min(delay, 5.0))
+        bucket.tokens -= 1
+        bucket.active += 1
+        try:
+            async with self._global:
+                yield
+        finally:
+            bucket.active -= 1
+            async with bucket.released:
+                bucket.released.notify()
+
+    def is_throttled(self, status=None, content=None):
+        if status in THROTTLE_STATUSES:
+            return True
+        # Challenge interstitials are short; real product pages merely mentioning "captcha" are not
+        return bool(content) and len(content) < 5000 and bool(CHALLENGE_MARKERS.search(content))
+
+    def report(self, url, status=None, content=None, retry_after=None):
+        """
+        Feeds a fetch outcome back into the host's bucket. Returns True when it was throttled.
+        """
+        bucket = self._bucket(url)
+        if self.is_throttled(status, content):
+            bucket.strikes += 1
+            bucket.rate = max(0.05, bucket.rate / 2)
+            backoff = retry_after if retry_after else min(60.0, 2 ** bucket.strikes)
+            bucket.blocked_until = time.monotonic() + backoff
+            bucket.tokens = 0
+            print(f"⚠️ [SCHEDULER] {urlparse(url).netloc} throttled (status={status}). Backing off {backoff:.0f}s, rate {bucket.rate:.2f}/s")
+            return True
+        bucket.strikes = 0
+        bucket.rate = min(bucket.base_rate, bucket.rate + 0.1)
+        return False
+
+
+crawl_scheduler = CrawlScheduler()
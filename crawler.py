@@ -1,46 +1,158 @@
 import asyncio
-from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
+import os
+import time
+from crawl4ai import CrawlerRunConfig, CacheMode
+from browser_pool import browser_pool
+from http_fetcher import http_fetcher, validators_from_headers
+from page_state import page_state, content_hash
+from crawl_scheduler import crawl_scheduler, THROTTLE_STATUSES
+from crawl_profiles import extract_image_urls
+from frontier import CrawlFrontier, extract_canonical_link
 
 from urllib.parse import urljoin, urlparse
 
 EXCLUDED_KEYWORDS = ["login", "signup", "register", "cart", "checkout", "account", "profile", "wishlist", "help", "contact", "about", "privacy", "terms", "policy", "travel", "flights", "hotels", "bus", "train", "tickets"]
 
+# Upper bound on scroll steps per page; infinite-scroll grids get a higher cap
+DEFAULT_MAX_SCROLL_STEPS = int(os.getenv("CRAWL_MAX_SCROLL_STEPS", 12))
+SCROLL_STEP_CAPS = {
+    "amazon.in": 6,
+    "amazon.com": 6,
+    "flipkart.com": 10,
+    "ebay.com": 6,
+    "myntra.com": 25,
+    "ajio.com": 25,
+}
+
+# Scrolls until the page settles: no DOM mutations and no new network requests
+# for a short idle window, and the <img> count stops growing at the bottom of the page.
+ADAPTIVE_SCROLL_JS = """
+(async () => {
+    const maxSteps = __MAX_STEPS__;
+    const idleMs = 500;
+    const stepTimeoutMs = 3000;
+    const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+    const swapImages = () => {
+        document.querySelectorAll('img').forEach(img => {
+            const lazyAttrs = ['data-src', 'data-original', 'data-lazy', 'data-srcset'];
+            for (const attr of lazyAttrs) {
+                if (img.getAttribute(attr)) {
+                    img.src = img.getAttribute(attr);
+                }
+            }
+        });
+    };
+    const imageCount = () => document.images.length;
+    const resourceCount = () => performance.getEntriesByType('resource').length;
+
+    let lastMutation = performance.now();
+    const observer = new MutationObserver(() => { lastMutation = performance.now(); });
+    observer.observe(document.body, { childList: true, subtree: true, attributes: true, attributeFilter: ['src', 'srcset'] });
+
+    const waitForIdle = async () => {
+        const start = performance.now();
+        let resources = resourceCount();
+        let lastRequest = performance.now();
+        while (performance.now() - start < stepTimeoutMs) {
+            await sleep(100);
+            const current = resourceCount();
+            if (current !== resources) {
+                resources = current;
+                lastRequest = performance.now();
+            }
+            const now = performance.now();
+            if (now - lastMutation >= idleMs && now - lastRequest >= idleMs) return;
+        }
+    };
+
+    swapImages();
+    await waitForIdle();
+    let images = imageCount();
+    let stableSteps = 0;
+    let steps = 0;
+    for (; steps < maxSteps; steps++) {
+        window.scrollBy(0, window.innerHeight);
+        swapImages();
+        await waitForIdle();
+        const current = imageCount();
+        const atBottom = window.innerHeight + window.scrollY >= document.body.scrollHeight - 2;
+        if (current <= images && atBottom) {
+            stableSteps++;
+            if (stableSteps >= 2) break;
+        } else {
+            stableSteps = 0;
+        }
+        images = current;
+    }
+    swapImages(); // Final pass
+    observer.disconnect();
+    return { steps: steps, images: imageCount() };
+})();
+"""
+
+def get_scroll_step_cap(url):
+    host = urlparse(url).netloc.lower()
+    for domain, cap in SCROLL_STEP_CAPS.items():
+        if host == domain or host.endswith("." + domain):
+            return cap
+    return DEFAULT_MAX_SCROLL_STEPS
+
 async def crawl_site(url: str, crawler=None):
     """
-    Crawls a given URL using configuration compatible with crawl4ai 0.8.0.
-    Accepts an optional crawler instance for reuse.
+    Crawls a given URL and returns (markdown, internal_links).
+    Accepts an optional crawler instance for reuse, otherwise leases one from the browser pool.
     """
-    import os
-    proxy_url = os.getenv("PROXY_URL")
-    
-    browser_config = BrowserConfig(
-        headless=True,
-        extra_args=["--disable-gpu", "--disable-dev-shm-usage"],
-        proxy=proxy_url if proxy_url else None
-    )
-    
-    # Slower, more thorough scroll script with lazy-load attribute swap
-    js_scroll = """
-    (async () => {
-        const swapImages = () => {
-            document.querySelectorAll('img').forEach(img => {
-                const lazyAttrs = ['data-src', 'data-original', 'data-lazy', 'data-srcset'];
-                for (const attr of lazyAttrs) {
-                    if (img.getAttribute(attr)) {
-                        img.src = img.getAttribute(attr);
-                    }
-                }
-            });
-        };
-        
-        for (let i = 0; i < 5; i++) {
-            window.scrollBy(0, window.innerHeight);
-            swapImages();
-            await new Promise(resolve => setTimeout(resolve, 1500));
-        }
-        swapImages(); // Final pass
-    })();
+    page = await fetch_page(url, crawler=crawler)
+    if not page:
+        return None, []
+    return page["content"], page["links"]
+
+def _mark_unchanged(page, state):
+    """
+    Adds content_hash and an 'unchanged' flag comparing against the last processed state.
     """
+    page["content_hash"] = content_hash(page["content"])
+    page["unchanged"] = bool(state and state.get("content_hash") == page["content_hash"])
+    if page["unchanged"]:
+        print(f"DEBUG: Content unchanged since last sync: {page['url']}")
+    return page
+
+async def fetch_page(url: str, crawler=None, allow_http=True, conditional=False):
+    """
+    Fetches a URL and returns a page dict (url, content, links, html, canonical_url, tier)
+    or None on failure. Tries a plain HTTP GET first and escalates to the browser only
+    when the static result looks JS-dependent or the domain needed the browser before.
+    With conditional=True the stored page state is used for If-None-Match/If-Modified-Since
+    and content-hash comparison; unchanged pages come back with unchanged=True
+    (and content=None when the server answered 304).
+    """
+    started = time.perf_counter()
+    state = page_state.get(url) if conditional else None
+    if allow_http and http_fetcher.preferred_tier(url) == "http":
+        page = await http_fetcher.fetch(url, validators=state if state and state.get("content_hash") else None)
+        if page and page["status"] == 304:
+            print(f"DEBUG: Not modified since last sync (304): {url}")
+            return {
+                "url": url, "content": None, "links": state["links"], "html": "",
+                "canonical_url": None, "tier": "http", "unchanged": True,
+                "content_hash": state["content_hash"], "validators": state,
+                "elapsed": round(time.perf_counter() - started, 3),
+            }
+        if page and page["status"] in THROTTLE_STATUSES:
+            # Rate limited: escalating to a browser would only hammer the host harder
+            print(f"DEBUG: {url} answered {page['status']}. Not escalating.")
+            return page
+        if page and page["content"] and not http_fetcher.looks_js_dependent(page["html"], page["content"]):
+            http_fetcher.record_tier(url, "http")
+            elapsed = time.perf_counter() - started
+            print(f"⏱️ [FETCH] {url} took {elapsed:.2f}s (http tier)")
+            page["tier"] = "http"
+            page["elapsed"] = round(elapsed, 3)
+            page["image_urls"] = extract_image_urls(page["html"], url)
+            return _mark_unchanged(page, state)
+        print(f"DEBUG: Static fetch insufficient for {url}. Escalating to browser...")
+
+    max_steps = get_scroll_step_cap(url)
 
     run_config = CrawlerRunConfig(
         cache_mode=CacheMode.BYPASS,
@@ -48,20 +160,28 @@ async def crawl_site(url: str, crawler=None):
         wait_for="body",
         page_timeout=90000,  # 90 seconds
         wait_for_timeout=60000, # 60s
-        js_code=js_scroll
+        js_code=ADAPTIVE_SCROLL_JS.replace("__MAX_STEPS__", str(max_steps))
     )
 
     if crawler is None:
         try:
-            async with AsyncWebCrawler(config=browser_config) as crawler:
-                return await _do_crawl(crawler, url, run_config)
+            async with browser_pool.lease() as crawler:
+                page = await _do_crawl(crawler, url, run_config)
         except Exception as e:
-            if "Browser.close" in str(e) or "closed" in str(e).lower():
-                print(f"DEBUG: Browser closed unexpectedly during cleanup for {url}. Ignoring.")
-                return None, [] # Or re-raise if this is not the desired behavior
-            raise # Re-raise other exceptions
+            # The pool has already recycled the crashed browser
+            print(f"ERROR: Browser crashed while crawling {url}: {e}")
+            return None
     else:
-        return await _do_crawl(crawler, url, run_config)
+        page = await _do_crawl(crawler, url, run_config)
+
+    elapsed = time.perf_counter() - started
+    print(f"⏱️ [CRAWL] {url} took {elapsed:.2f}s (browser tier, scroll cap {max_steps})")
+    if page:
+        http_fetcher.record_tier(url, "browser")
+        page["tier"] = "browser"
+        page["elapsed"] = round(elapsed, 3)
+        _mark_unchanged(page, state)
+    return page
 
 async def _do_crawl(crawler, url, run_config):
     try:
@@ -74,90 +194,180 @@ async def _do_crawl(crawler, url, run_config):
                 result = await crawler.arun(url=url, config=run_config)
                 content = result.markdown
             print(f"Successfully crawled: {url}")
-            return content, result.links.get("internal", [])
+            browser_pool.report_result(crawler, True)
+            html = result.html or ""
+            return {
+                "url": url,
+                "content": content,
+                "links": result.links.get("internal", []),
+                "html": html,
+                "canonical_url": extract_canonical_link(html, url),
+                "image_urls": extract_image_urls(html, url),
+                "status": result.status_code,
+                "validators": validators_from_headers(result.response_headers),
+            }
         else:
             print(f"Failed to crawl: {url}. Error: {result.error_message}")
-            return None, []
+            browser_pool.report_result(crawler, False)
+            return None
     except Exception as e:
         print(f"Unexpected error crawling {url}: {e}")
-        return None, []
+        browser_pool.report_result(crawler, False)
+        return None
 
-async def crawl_site_recursive(base_url: str, max_pages: int = 20):
+async def crawl_site_recursive(base_url: str, max_pages: int = 20, max_depth: int = 3, max_per_prefix: int = None, conditional: bool = False, concurrency: int = None, seed_urls: list = None, on_page=None, checkpoint: dict = None, on_checkpoint=None):
     """
     Concurrent recursive crawl starting from base_url up to max_pages.
+    Worker tasks pull from the frontier through the shared politeness scheduler,
+    and each page leases its own browser from the shared pool. Links are deduped on their
+    canonical form, and depth / per-path-prefix caps keep the budget on distinct pages.
+    With conditional=True, pages unchanged since the last sync are returned with
+    unchanged=True so callers can skip re-processing them. seed_urls (e.g. from sitemap
+    discovery) are crawled before base_url and its links. When an async on_page callback
+    is given, each page is handed to it as soon as it is fetched instead of being collected,
+    and an empty list is returned. on_checkpoint receives a resumable snapshot after each
+    finished page; passing that snapshot back as `checkpoint` continues the crawl.
     """
-    import os
-    proxy_url = os.getenv("PROXY_URL")
-    
-    browser_config = BrowserConfig(
-        headless=True,
-        extra_args=["--disable-gpu", "--disable-dev-shm-usage"],
-        proxy=proxy_url if proxy_url else None
+    base_netloc = urlparse(base_url).netloc
+    frontier = CrawlFrontier(
+        max_depth=max_depth,
+        max_per_prefix=max_per_prefix or max(5, max_pages // 3)
     )
-    
-    pages_to_crawl = [base_url]
-    crawled_urls = set()
+    crawled_count = 0
+    if checkpoint:
+        frontier.restore(checkpoint["frontier"])
+        crawled_count = checkpoint.get("completed", 0)
+        print(f"DEBUG: Resuming crawl of {base_url} from checkpoint ({crawled_count} pages done, {len(frontier)} queued)")
+    else:
+        for seed in seed_urls or []:
+            frontier.push(seed, depth=1)
+        frontier.push(base_url, depth=0)
+    crawl_started = time.perf_counter()
+    completed_count = crawled_count
+    # Entries popped by each worker and not finished yet, so checkpoints can put them back
+    pending = {}
+    in_flight = 0
+    throttle_retries = {}
     all_content = []
-    
-    # Use semaphore to limit concurrency and avoid rate limits
-    semaphore = asyncio.Semaphore(3)
-
-    async def crawl_with_semaphore(url, crawler):
-        async with semaphore:
-            try:
-                content, internal_links = await crawl_site(url, crawler=crawler)
-                return url, content, internal_links
-            except Exception as e:
-                print(f"Error crawling {url}: {e}")
-                return url, None, []
+    # Wakes idle workers when new links arrive or the last in-flight fetch finishes
+    frontier_changed = asyncio.Condition()
+
+    def handle_page(url, depth, page):
+        """
+        Records a fetched page and expands the frontier. Returns the page entry or None.
+        """
+        nonlocal crawled_count
+        if not page or not (page["content"] or page.get("unchanged")):
+            return None
+        if not frontier.mark_crawled(url, page.get("canonical_url")):
+            print(f"DEBUG: Skipping duplicate of an already crawled page: {url}")
+            return None
+        entry = {
+            "url": url,
+            "content": page["content"],
+            "html": page.get("html", ""),
+            "elapsed": page.get("elapsed"),
+            "unchanged": page.get("unchanged", False),
+            "content_hash": page.get("content_hash"),
+            "validators": page.get("validators"),
+            "links": page["links"],
+            "image_urls": page.get("image_urls", []),
+        }
+        crawled_count += 1
+        
+        # Add new internal links to the frontier
+        for link in page["links"]:
+            link_url = link.get("href")
+            if link_url:
+                full_url = urljoin(url, link_url)
+                if urlparse(full_url).netloc == base_netloc:
+                    if not any(kw in full_url.lower() for kw in EXCLUDED_KEYWORDS):
+                        frontier.push(full_url, depth=depth + 1)
+        return entry
+
+    async def worker(worker_id):
+        nonlocal in_flight, completed_count
+        while True:
+            async with frontier_changed:
+                while True:
+                    if crawled_count + in_flight >= max_pages:
+                        return
+                    entry = frontier.pop()
+                    if entry is not None:
+                        break
+                    if in_flight == 0:
+                        return
+                    await frontier_changed.wait()
+                in_flight += 1
+                pending[worker_id] = entry
 
+            url, depth = entry
+            page = None
+            if not any(kw in url.lower() for kw in EXCLUDED_KEYWORDS):
+                try:
+                    async with crawl_scheduler.slot(url):
+                        page = await fetch_page(url, conditional=conditional)
+                    status = page.get("status") if page else None
+                    if crawl_scheduler.report(url, status, page.get("content") if page else None,
+                                              retry_after=page.get("retry_after") if page else None):
+                        page = None
+                        # Give throttled URLs another chance once the host has cooled down
+                        throttle_retries[url] = throttle_retries.get(url, 0) + 1
+                        if throttle_retries[url] <= 2:
+                            frontier.requeue(url, depth)
+                except Exception as e:
+                    print(f"Error crawling {url}: {e}")
+                    page = None
+
+            async with frontier_changed:
+                in_flight -= 1
+                entry = handle_page(url, depth, page)
+                frontier_changed.notify_all()
+
+            if entry is not None:
+                if on_page is not None:
+                    # Streaming mode: a full downstream queue slows the crawl down (backpressure)
+                    await on_page(entry)
+                else:
+                    all_content.append(entry)
+                completed_count += 1
+            del pending[worker_id]
+
+            if on_checkpoint is not None:
+                await on_checkpoint({
+                    "frontier": frontier.snapshot(pending=list(pending.values())),
+                    "completed": completed_count,
+                })
+
+    # Workers pull from the frontier continuously instead of waiting on per-batch gathers
+    workers = concurrency or crawl_scheduler.host_concurrency
+    tasks = [asyncio.create_task(worker(i)) for i in range(workers)]
     try:
-        async with AsyncWebCrawler(config=browser_config) as crawler:
-            while pages_to_crawl and len(crawled_urls) < max_pages:
-                # Prepare batch of URLs
-                batch_size = min(len(pages_to_crawl), 3)
-                current_batch = []
-                for _ in range(batch_size):
-                    u = pages_to_crawl.pop(0)
-                    if u not in crawled_urls and not any(kw in u.lower() for kw in EXCLUDED_KEYWORDS):
-                        current_batch.append(u)
-                
-                if not current_batch:
-                    continue
-
-                tasks = [crawl_with_semaphore(u, crawler) for u in current_batch]
-                results = await asyncio.gather(*tasks)
-                
-                for url, content, internal_links in results:
-                    if content:
-                        all_content.append({"url": url, "content": content})
-                        crawled_urls.add(url)
-                        
-                        # Add new internal links to queue
-                        for link in internal_links:
-                            link_url = link.get("href")
-                            if link_url:
-                                full_url = urljoin(url, link_url)
-                                if urlparse(full_url).netloc == urlparse(base_url).netloc:
-                                    if not any(kw in full_url.lower() for kw in EXCLUDED_KEYWORDS):
-                                        if full_url not in crawled_urls and full_url not in pages_to_crawl:
-                                            pages_to_crawl.append(full_url)
-                
-                # Small yield to allow event loop to breathe
-                await asyncio.sleep(0.1)
-                
-    except Exception as e:
-        if "Browser.close" in str(e) or "closed" in str(e).lower():
-            print(f"DEBUG: Browser closed unexpectedly, continuing...")
-        else:
-            print(f"ERROR: Fatal error in recursive crawl: {e}")
+        await asyncio.gather(*tasks)
+    except BaseException as e:
+        # One failed worker (e.g. on_page raising) stops the crawl; the caller decides what failed
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if not isinstance(e, asyncio.CancelledError):
+            print(f"ERROR: Fatal error in recursive crawl of {base_url}: {e}")
+        raise
 
+    total = time.perf_counter() - crawl_started
+    print(f"⏱️ [CRAWL] {crawled_count} pages from {base_url} in {total:.2f}s ({total / max(crawled_count, 1):.2f}s/page)")
     return all_content
 
+async def _main(url):
+    try:
+        return await crawl_site(url)
+    finally:
+        await browser_pool.close()
+        await http_fetcher.close()
+
 if __name__ == "__main__":
     # Test crawling
     test_url = "https://vite.dev/guide/"
-    content = asyncio.run(crawl_site(test_url))
+    content = asyncio.run(_main(test_url))
     if content:
         print("\nExtracted Content (First 500 chars):")
         print(content[:500])
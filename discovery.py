@@ -0,0 +1,168 @@
+import asyncio
+import gzip
+import re
+from urllib.parse import urljoin, urlparse
+from urllib.robotparser import RobotFileParser
+from http_fetcher import http_fetcher
+from frontier import canonicalize_url
+
+DEFAULT_SITEMAP_PATHS = ["/sitemap.xml", "/sitemap_index.xml", "/sitemap-index.xml", "/product-sitemap.xml"]
+
+# Common product feed locations: Shopify JSON endpoints and Google Merchant style XML feeds
+SHOPIFY_FEED_PATHS = ["/products.json?limit=250", "/collections/all/products.json?limit=250"]
+XML_FEED_PATHS = ["/feeds/products.xml", "/products.xml", "/google_shopping.xml", "/feed/products.xml"]
+
+PRODUCT_URL_PATTERNS = [
+    re.compile(p, re.IGNORECASE) for p in [
+        r"/products?/[^/]+", r"/p/[^/]+", r"/dp/[A-Z0-9]{10}", r"/item/", r"/itm/",
+        r"-p-\d+", r"/pd/", r"/buy/?$", r"/\d{6,}(?:\.html)?$", r"/sku/",
+    ]
+]
+
+# Target categories that mean "everything", so no URL filtering should be applied
+GENERIC_CATEGORIES = {"", "relevant", "products", "all"}
+# Query words that say nothing about what kind of product is wanted
+CATEGORY_STOPWORDS = {
+    "the", "and", "for", "with", "best", "top", "cheap", "buy", "under", "below", "above", "over",
+    "price", "online", "new", "latest", "good", "men", "women", "kids",
+}
+
+_LOC_RE = re.compile(r"<loc>\s*(.*?)\s*</loc>", re.IGNORECASE | re.DOTALL)
+_FEED_LINK_RE = re.compile(r"<(?:g:)?link>\s*(.*?)\s*</(?:g:)?link>", re.IGNORECASE | re.DOTALL)
+
+MAX_SITEMAPS = 25
+MAX_DISCOVERED_URLS = 5000
+
+
+def is_product_url(url):
+    path = urlparse(url).path
+    return any(p.search(path) for p in PRODUCT_URL_PATTERNS)
+
+
+def category_keywords(target_category):
+    """
+    Keywords that identify a target category or query, shared by URL discovery and
+    product filtering. Generic categories yield none.
+    """
+    if not target_category or target_category.strip().lower() in GENERIC_CATEGORIES:
+        return []
+    words = re.split(r"[^a-z0-9]+", target_category.lower())
+    # Match both "toys" and "toy", "shoes" and "shoe"
+    return list({w.rstrip("s") for w in words if len(w) > 2 and not w.isdigit() and w not in CATEGORY_STOPWORDS})
+
+
+def _decode_body(url, content):
+    if url.endswith(".gz") or content[:2] == b"\x1f\x8b":
+        try:
+            content = gzip.decompress(content)
+        except OSError:
+            return ""
+    return content.decode("utf-8", errors="ignore")
+
+
+class SitemapDiscovery:
+    """
+    Finds product URLs for a store without link-following: robots.txt Sitemap entries,
+    (gzipped) sitemap indexes and well-known product feeds.
+    """
+    async def _fetch_text(self, url):
+        response = await http_fetcher.get_raw(url)
+        if response is None or response.status_code != 200:
+            return ""
+        return _decode_body(url, response.content)
+
+    async def _read_robots(self, origin):
+        text = await self._fetch_text(urljoin(origin, "/robots.txt"))
+        robots = RobotFileParser()
+        robots.parse(text.splitlines())
+        sitemaps = [line.split(":", 1)[1].strip() for line in text.splitlines() if line.lower().startswith("sitemap:")]
+        return robots, sitemaps
+
+    async def _walk_sitemaps(self, sitemap_urls):
+        pending = list(dict.fromkeys(sitemap_urls))
+        visited = set()
+        found = []
+        while pending and len(visited) < MAX_SITEMAPS and len(found) < MAX_DISCOVERED_URLS:
+            batch = [u for u in pending[:5] if u not in visited]
+            pending = pending[5:]
+            visited.update(batch)
+            bodies = await asyncio.gather(*(self._fetch_text(u) for u in batch))
+            for body in bodies:
+                locs = [loc.replace("&amp;", "&") for loc in _LOC_RE.findall(body)]
+                if "<sitemapindex" in body[:2000].lower():
+                    # Product sitemaps first, they carry the most useful URLs
+                    locs.sort(key=lambda u: 0 if "product" in u.lower() else 1)
+                    pending.extend(u for u in locs if u not in visited)
+                else:
+                    found.extend(locs)
+        return found
+
+    async def _read_feeds(self, origin):
+        """
+        Returns (url, searchable_text) pairs from the first product feed that answers.
+        """
+        found = []
+        for path in SHOPIFY_FEED_PATHS:
+            response = await http_fetcher.get_raw(urljoin(origin, path))
+            if response is None or response.status_code != 200:
+                continue
+            try:
+                products = response.json().get("products", [])
+            except Exception:
+                continue
+            for p in products:
+                if not p.get("handle"):
+                    continue
+                tags = p.get("tags") or []
+                if isinstance(tags, str):
+                    tags = [tags]
+                text = " ".join([p["handle"], p.get("title") or "", p.get("product_type") or ""] + tags)
+                found.append((urljoin(origin, f"/products/{p['handle']}"), text))
+            if found:
+                return found
+        for path in XML_FEED_PATHS:
+            body = await self._fetch_text(urljoin(origin, path))
+            links = [l.replace("&amp;", "&") for l in _FEED_LINK_RE.findall(body)]
+            found.extend((l, l) for l in links if l.startswith("http"))
+            if found:
+                return found
+        return found
+
+    async def discover(self, seed_url, target_category=None, limit=100):
+        """
+        Returns up to `limit` same-host URLs for seed_url, product-detail URLs first,
+        filtered to the target category when one is given.
+        """
+        parsed = urlparse(seed_url)
+        origin = f"{parsed.scheme}://{parsed.netloc}"
+        robots, sitemaps = await self._read_robots(origin)
+        if not sitemaps:
+            sitemaps = [urljoin(origin, p) for p in DEFAULT_SITEMAP_PATHS]
+
+        sitemap_urls, feed_urls = await asyncio.gather(self._walk_sitemaps(sitemaps), self._read_feeds(origin))
+
+        keywords = category_keywords(target_category)
+        seed_path = parsed.path.rstrip("/")
+        products, others = [], []
+        seen = set()
+        for url, text in feed_urls + [(u, u) for u in sitemap_urls]:
+            if urlparse(url).netloc != parsed.netloc:
+                continue
+            canonical = canonicalize_url(url)
+            if canonical in seen:
+                continue
+            seen.add(canonical)
+            if not robots.can_fetch("*", url):
+                continue
+            lowered = text.lower()
+            in_category = not keywords or any(k in lowered for k in keywords) or (seed_path and seed_path.lower() in lowered)
+            if not in_category:
+                continue
+            (products if is_product_url(url) else others).append(url)
+
+        print(f"DEBUG: Discovery for {origin}: {len(products)} product URLs, {len(others)} other URLs "
+              f"({len(sitemap_urls)} from sitemaps, {len(feed_urls)} from feeds)")
+        return (products + others)[:limit]
+
+
+sitemap_discovery = SitemapDiscovery()
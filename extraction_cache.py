@@ -0,0 +1,132 @@
+import asyncio
+import sqlite3
+import hashlib
+import json
+import os
+import time
+from page_state import content_hash
+
+
+class ExtractionCache:
+    """
+    Persistent cache of LLM product extractions keyed by
+    (normalized content hash, target category, prompt version, model).
+    Unchanged page text never costs a second LLM call until the entry expires.
+    """
+    def __init__(self, db_path="extraction_cache.sqlite3", ttl=None, max_entries=None):
+        self.db_path = db_path
+        self.ttl = ttl or int(os.getenv("EXTRACTION_CACHE_TTL", 7 * 24 * 3600))
+        self.max_entries = max_entries or int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", 5000))
+        self._init_db()
+
+    def _init_db(self):
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS extractions (
+                        cache_key TEXT PRIMARY KEY,
+                        products TEXT NOT NULL,
+                        tokens INTEGER DEFAULT 0,
+                        hits INTEGER DEFAULT 0,
+                        created_at REAL,
+                        last_used_at REAL
+                    )
+                ''')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS counters (
+                        name TEXT PRIMARY KEY,
+                        value INTEGER DEFAULT 0
+                    )
+                ''')
+        except Exception as e:
+            print(f"Error initializing extraction cache DB: {e}")
+
+    def make_key(self, content, target_category, prompt_version, model):
+        parts = [content_hash(content), (target_category or "").strip().lower(), str(prompt_version), model]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+    def _bump(self, conn, name, amount=1):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount)
+        )
+
+    def get(self, key):
+        """
+        Returns the cached product list, or None on a miss or expired entry.
+        """
+        try:
+            now = time.time()
+            with sqlite3.connect(self.db_path) as conn:
+                row = conn.execute(
+                    "SELECT products, tokens, created_at FROM extractions WHERE cache_key = ?", (key,)
+                ).fetchone()
+                if row is None or now - row[2] > self.ttl:
+                    if row is not None:
+                        conn.execute("DELETE FROM extractions WHERE cache_key = ?", (key,))
+                    self._bump(conn, "misses")
+                    return None
+                conn.execute(
+                    "UPDATE extractions SET hits = hits + 1, last_used_at = ? WHERE cache_key = ?", (now, key)
+                )
+                self._bump(conn, "hits")
+                self._bump(conn, "tokens_saved", row[1] or 0)
+                return json.loads(row[0])
+        except Exception as e:
+            print(f"Error reading extraction cache: {e}")
+            return None
+
+    def put(self, key, products, tokens=0):
+        """
+        Stores a non-empty list of product dicts. Empty or malformed results (failed parses,
+        truncated answers) are not cached, so they are retried instead of served for a week.
+        """
+        if not products or not isinstance(products, list) or not all(isinstance(p, dict) for p in products):
+            return
+        try:
+            now = time.time()
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO extractions (cache_key, products, tokens, hits, created_at, last_used_at) "
+                    "VALUES (?, ?, ?, 0, ?, ?)",
+                    (key, json.dumps(products), tokens, now, now)
+                )
+                self._evict(conn, now)
+        except Exception as e:
+            print(f"Error saving to extraction cache: {e}")
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM extractions WHERE created_at < ?", (now - self.ttl,))
+        # Over capacity: drop the least recently used entries
+        conn.execute(
+            "DELETE FROM extractions WHERE cache_key IN ("
+            "SELECT cache_key FROM extractions ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    # Async wrappers for use inside the event loop
+    async def aget(self, key):
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key, products, tokens=0):
+        await asyncio.to_thread(self.put, key, products, tokens)
+
+    def stats(self):
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+                entries = conn.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+        except Exception:
+            return {}
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            "tokens_saved": counters.get("tokens_saved", 0),
+        }
+
+
+extraction_cache = ExtractionCache()
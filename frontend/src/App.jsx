@@ -67,14 +67,39 @@ function App() {
     setIsThinking(true)
 
     try {
-      const resp = await fetch('http://localhost:8000/chat', {
+      const resp = await fetch('http://localhost:8000/chat/stream', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ message: currentQuery })
       })
-      const data = await resp.json()
-      const botMsg = { role: 'bot', text: data.response }
-      setMessages(prev => [...prev, botMsg])
+      // Server-Sent Events: append summary tokens as they arrive, carousel once verified
+      setMessages(prev => [...prev, { role: 'bot', text: '' }])
+      const appendToBot = (text) => setMessages(prev => {
+        const next = [...prev]
+        const last = next[next.length - 1]
+        next[next.length - 1] = { ...last, text: last.text + text }
+        return next
+      })
+      const reader = resp.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+        const events = buffer.split('\n\n')
+        buffer = events.pop()
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1]
+          const dataLine = raw.match(/^data: (.*)$/m)?.[1]
+          if (!event || !dataLine) continue
+          const data = JSON.parse(dataLine)
+          if (event === 'token') appendToBot(data.text)
+          else if (event === 'carousel') appendToBot(`\n\n<product_carousel>\n${JSON.stringify(data.products)}\n</product_carousel>\n\n`)
+          else if (event === 'error') appendToBot('Error: ' + data.detail)
+          setIsThinking(false)
+        }
+      }
     } catch (err) {
       setMessages(prev => [...prev, { role: 'bot', text: 'Error: ' + err.message }])
     } finally {
@@ -0,0 +1,175 @@
+import re
+from collections import deque, Counter
+from urllib.parse import urlparse, urlunparse, urljoin, parse_qsl, urlencode
+
+# Query parameters that never change the page content (analytics, referral and session noise)
+TRACKING_PARAMS = {
+    "gclid", "gclsrc", "dclid", "fbclid", "msclkid", "yclid", "igshid", "srsltid",
+    "mc_cid", "mc_eid", "_ga", "_gl", "ref", "ref_", "referrer", "source", "src",
+    "spm", "scm", "sr", "qid", "crid", "sprefix", "psc", "th", "trk", "trkid",
+    "sessionid", "affid", "aff_id", "campaign", "cmp", "icid",
+}
+TRACKING_PREFIXES = ("utm_", "pf_rd_", "pd_rd_", "hsa_", "mkt_")
+
+# Facet parameters that only re-order or re-display the same listing
+FACET_PARAMS = {
+    "sort", "sort_by", "sortby", "order", "orderby", "dir", "direction",
+    "view", "display", "layout", "grid", "page_size", "pagesize", "per_page", "limit",
+}
+
+_LINK_TAG_RE = re.compile(r"<link\b[^>]*>", re.IGNORECASE)
+_REL_CANONICAL_RE = re.compile(r"""rel\s*=\s*["']?canonical["']?""", re.IGNORECASE)
+_HREF_RE = re.compile(r"""href\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+
+
+def canonicalize_url(url):
+    """
+    Normalizes a URL so trivially different variants of the same page compare equal.
+    Strips fragments and tracking/facet params, sorts the query string,
+    lowercases the host and drops default ports and trailing slashes.
+    """
+    if not url or not isinstance(url, str):
+        return None
+    parsed = urlparse(url.strip())
+    scheme = (parsed.scheme or "https").lower()
+    host = (parsed.hostname or "").lower()
+    if parsed.port and not ((scheme == "http" and parsed.port == 80) or (scheme == "https" and parsed.port == 443)):
+        host = f"{host}:{parsed.port}"
+
+    path = re.sub(r"/{2,}", "/", parsed.path or "/")
+    if len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/")
+
+    query = []
+    for key, value in parse_qsl(parsed.query, keep_blank_values=True):
+        k = key.lower()
+        if k in TRACKING_PARAMS or k in FACET_PARAMS or k.startswith(TRACKING_PREFIXES):
+            continue
+        query.append((key, value))
+    query.sort()
+
+    return urlunparse((scheme, host, path, "", urlencode(query), ""))
+
+
+def extract_canonical_link(html, page_url=None):
+    """
+    Returns the href of <link rel="canonical"> if the page declares one.
+    """
+    if not html:
+        return None
+    for tag in _LINK_TAG_RE.findall(html[:200000]):
+        if _REL_CANONICAL_RE.search(tag):
+            match = _HREF_RE.search(tag)
+            if match:
+                href = match.group(1).replace("&amp;", "&").strip()
+                if page_url:
+                    href = urljoin(page_url, href)
+                return href
+    return None
+
+
+class CrawlFrontier:
+    """
+    FIFO crawl frontier with O(1) enqueue/dequeue and dedupe on canonical URLs.
+    Enforces a maximum link depth and a cap on pages per path prefix,
+    so pagination or facet explosions cannot eat the whole page budget.
+    """
+    def __init__(self, max_depth=3, max_per_prefix=None, prefix_depth=2):
+        self.max_depth = max_depth
+        self.max_per_prefix = max_per_prefix
+        self.prefix_depth = prefix_depth
+        self._queue = deque()
+        self._seen = set()
+        self._crawled = set()
+        # Canonical URL -> every key mark_crawled recorded for it (incl. its rel=canonical target)
+        self._crawled_keys = {}
+        self._prefix_counts = Counter()
+
+    def _prefix(self, canonical):
+        parsed = urlparse(canonical)
+        parts = [p for p in parsed.path.split("/") if p][:self.prefix_depth]
+        return f"{parsed.netloc}/{'/'.join(parts)}"
+
+    def push(self, url, depth=0):
+        """
+        Enqueues url unless its canonical form was already seen or a cap is hit.
+        Returns True when the URL was accepted.
+        """
+        canonical = canonicalize_url(url)
+        if not canonical or canonical in self._seen:
+            return False
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+        prefix = self._prefix(canonical)
+        if self.max_per_prefix and self._prefix_counts[prefix] >= self.max_per_prefix:
+            return False
+        self._seen.add(canonical)
+        self._prefix_counts[prefix] += 1
+        self._queue.append((url, depth))
+        return True
+
+    def pop(self):
+        """
+        Returns the next (url, depth) pair, skipping pages already crawled under an alias.
+        """
+        while self._queue:
+            url, depth = self._queue.popleft()
+            if canonicalize_url(url) not in self._crawled:
+                return url, depth
+        return None
+
+    def requeue(self, url, depth):
+        """
+        Puts an already accepted URL back at the end of the queue (e.g. after throttling).
+        """
+        self._queue.append((url, depth))
+
+    def mark_crawled(self, url, canonical_link=None):
+        """
+        Records a fetched page under its own canonical form and its rel=canonical target.
+        Returns False when the page is a duplicate of one already crawled.
+        """
+        keys = {canonicalize_url(url)}
+        if canonical_link and urlparse(canonical_link).netloc == urlparse(url).netloc:
+            keys.add(canonicalize_url(canonical_link))
+        keys.discard(None)
+        if keys & self._crawled:
+            return False
+        self._crawled.update(keys)
+        self._seen.update(keys)
+        self._crawled_keys[canonicalize_url(url)] = sorted(keys)
+        return True
+
+    def snapshot(self, pending=None):
+        """
+        Serializable frontier state for checkpointing. `pending` lists (url, depth) entries
+        that were popped but not finished yet; they are put back at the front on restore.
+        """
+        return {
+            "queue": [list(e) for e in (pending or [])] + [list(e) for e in self._queue],
+            "seen": sorted(self._seen),
+            "crawled": sorted(self._crawled),
+            # Only unfinished pages need their keys back, to be un-marked on restore
+            "crawled_keys": {
+                canonicalize_url(url): self._crawled_keys[canonicalize_url(url)]
+                for url, _ in pending or [] if canonicalize_url(url) in self._crawled_keys
+            },
+            "prefix_counts": dict(self._prefix_counts),
+        }
+
+    def restore(self, data):
+        self._queue = deque((url, depth) for url, depth in data.get("queue", []))
+        self._seen = set(data.get("seen", []))
+        self._crawled = set(data.get("crawled", []))
+        self._prefix_counts = Counter(data.get("prefix_counts", {}))
+        self._crawled_keys = {}
+        crawled_keys = data.get("crawled_keys", {})
+        # Pages interrupted mid-processing were already marked crawled, possibly under their
+        # rel=canonical target too; drop every key so they run again
+        for url, _ in self._queue:
+            canonical = canonicalize_url(url)
+            for key in crawled_keys.get(canonical, [canonical]):
+                self._crawled.discard(key)
+
+    def __len__(self):
+        return len(self._queue)
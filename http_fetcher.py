@@ -0,0 +1,183 @@
+import asyncio
+import os
+import re
+import time
+import httpx
+from urllib.parse import urljoin, urlparse
+from bs4 import BeautifulSoup
+from crawl4ai import DefaultMarkdownGenerator
+from frontier import extract_canonical_link
+
+# Static pages shorter than this are assumed to need JavaScript rendering
+MIN_STATIC_MARKDOWN_CHARS = 1500
+# A 'browser' tier decision is re-probed with plain HTTP after this long
+BROWSER_TIER_TTL = int(os.getenv("BROWSER_TIER_TTL", 1800))
+
+PRODUCT_MARKERS = [
+    re.compile(r"(?:₹|\$|€|£|Rs\.?|INR|USD)\s?\d", re.IGNORECASE),
+    re.compile(r"itemprop=[\"']price", re.IGNORECASE),
+    re.compile(r"[\"']@type[\"']\s*:\s*[\"'](?:Product|Offer|ItemList)[\"']", re.IGNORECASE),
+    re.compile(r"add to (?:cart|bag|basket)", re.IGNORECASE),
+]
+
+SPA_SHELL_MARKERS = [
+    re.compile(r"<div[^>]+id=[\"'](?:root|app|__next|__nuxt)[\"'][^>]*>\s*</div>", re.IGNORECASE),
+    re.compile(r"<app-root[^>]*>\s*</app-root>", re.IGNORECASE),
+    re.compile(r"<noscript>[^<]*(?:enable|requires?) javascript", re.IGNORECASE),
+]
+
+
+def validators_from_headers(headers):
+    """
+    Pulls the HTTP cache validators out of a response header mapping (any key casing).
+    """
+    lowered = {str(k).lower(): v for k, v in (headers or {}).items()}
+    return {"etag": lowered.get("etag"), "last_modified": lowered.get("last-modified")}
+
+
+class HttpFetcher:
+    """
+    Cheap first tier for page fetching: a pooled async HTTP GET converted to the same
+    markdown/links shape the browser tier produces. Remembers per domain which tier
+    worked last, so JS-heavy sites go straight to Chromium next time.
+    """
+    def __init__(self):
+        self.proxy_url = os.getenv("PROXY_URL")
+        self.user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+        self.client = None
+        # (host, page type) -> (tier, recorded_at)
+        self.domain_tiers = {}
+        self.markdown_generator = DefaultMarkdownGenerator()
+
+    def _get_client(self):
+        if self.client is None:
+            limits = httpx.Limits(max_connections=50, max_keepalive_connections=20)
+            headers = {
+                "User-Agent": self.user_agent,
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                "Accept-Language": "en-US,en;q=0.9",
+            }
+            kwargs = {"timeout": 15.0, "follow_redirects": True, "limits": limits, "headers": headers}
+            if self.proxy_url:
+                kwargs["proxy"] = self.proxy_url
+            self.client = httpx.AsyncClient(**kwargs)
+        return self.client
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def get_raw(self, url, timeout=15.0):
+        """
+        Plain GET on the shared pool for non-page resources (robots.txt, sitemaps, feeds).
+        Returns the response or None on network errors.
+        """
+        try:
+            return await self._get_client().get(url, timeout=timeout)
+        except Exception as e:
+            print(f"DEBUG: HTTP fetch error for {url}: {e}")
+            return None
+
+    def _tier_key(self, url):
+        # Local import: discovery uses this module's fetcher
+        from discovery import is_product_url
+        # A JS-only cart or category page must not push a site's static product pages to the browser
+        return urlparse(url).netloc.lower(), "product" if is_product_url(url) else "page"
+
+    def preferred_tier(self, url):
+        tier, recorded_at = self.domain_tiers.get(self._tier_key(url), ("http", 0))
+        if tier == "browser" and time.time() - recorded_at > BROWSER_TIER_TTL:
+            # Sites change; give the cheap static fetch another chance
+            return "http"
+        return tier
+
+    def record_tier(self, url, tier):
+        key = self._tier_key(url)
+        if self.domain_tiers.get(key, (None,))[0] != tier:
+            print(f"DEBUG: Fetch tier for {key[0]} ({key[1]} pages) is now '{tier}'")
+        self.domain_tiers[key] = (tier, time.time())
+
+    def _extract_links(self, html, base_url):
+        soup = BeautifulSoup(html, "html.parser")
+        base_netloc = urlparse(base_url).netloc
+        internal, external = [], []
+        seen = set()
+        for a in soup.find_all("a", href=True):
+            href = a["href"].strip()
+            if not href or href.startswith(("#", "javascript:", "mailto:", "tel:")):
+                continue
+            full_url = urljoin(base_url, href)
+            if full_url in seen:
+                continue
+            seen.add(full_url)
+            link = {"href": full_url, "text": a.get_text(" ", strip=True)[:200]}
+            if urlparse(full_url).netloc == base_netloc:
+                internal.append(link)
+            else:
+                external.append(link)
+        return {"internal": internal, "external": external}
+
+    def looks_js_dependent(self, html, markdown):
+        """
+        True when the static HTML is probably an unrendered shell that needs a browser.
+        """
+        if len((markdown or "").strip()) < MIN_STATIC_MARKDOWN_CHARS:
+            return True
+        if any(p.search(html) for p in SPA_SHELL_MARKERS):
+            return True
+        if not any(p.search(html) for p in PRODUCT_MARKERS):
+            return True
+        return False
+
+    def _render(self, html, base_url):
+        markdown = self.markdown_generator.generate_markdown(
+            input_html=html, base_url=base_url, citations=False
+        ).raw_markdown
+        return markdown, self._extract_links(html, base_url).get("internal", [])
+
+    async def fetch(self, url, validators=None):
+        """
+        Returns a page dict like crawler.fetch_page plus a 'status' field,
+        or None when the request itself fails. Passing the validators stored for
+        the page makes the request conditional; a 304 comes back with status 304.
+        """
+        headers = {}
+        if validators:
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+        try:
+            response = await self._get_client().get(url, headers=headers)
+        except Exception as e:
+            print(f"DEBUG: HTTP fetch error for {url}: {e}")
+            return None
+
+        if response.status_code == 304:
+            return {"url": url, "status": 304, "content": None, "links": [], "html": ""}
+
+        content_type = response.headers.get("Content-Type", "")
+        if response.status_code != 200 or "html" not in content_type.lower():
+            retry_after = response.headers.get("Retry-After", "")
+            return {
+                "url": url, "status": response.status_code, "content": None, "links": [], "html": "",
+                "retry_after": float(retry_after) if retry_after.isdigit() else None,
+            }
+
+        html = response.text
+        final_url = str(response.url)
+        # Markdown conversion and link parsing are CPU-bound; keep them off the event loop
+        markdown, links = await asyncio.to_thread(self._render, html, final_url)
+        return {
+            "url": url,
+            "status": response.status_code,
+            "content": markdown,
+            "links": links,
+            "html": html,
+            "canonical_url": extract_canonical_link(html, final_url),
+            "validators": validators_from_headers(response.headers),
+        }
+
+
+http_fetcher = HttpFetcher()
@@ -1,14 +1,75 @@
+import asyncio
 import sqlite3
 import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+# First retry delay per failure reason; doubles on every repeat failure up to FAILURE_MAX_BACKOFF.
+# Missing and undersized images rarely come back, timeouts often do.
+FAILURE_BACKOFF = {
+    "not_found": 24 * 3600,
+    "forbidden": 6 * 3600,
+    "too_small": 7 * 24 * 3600,
+    "too_large": 7 * 24 * 3600,
+    "not_image": 24 * 3600,
+    "timeout": 15 * 60,
+    "connect_error": 30 * 60,
+    "transport_error": 30 * 60,
+}
+# The host served these fine, the image itself was unusable; they say nothing about blocking
+CONTENT_FAILURES = {"too_small", "too_large", "not_image"}
+DEFAULT_FAILURE_BACKOFF = 3600
+FAILURE_MAX_BACKOFF = int(os.getenv("IMAGE_FAILURE_MAX_BACKOFF", 30 * 24 * 3600))
+# A host is skipped once this many downloads failed at this rate (hotlink-blocking CDNs)
+HOST_BLOCK_MIN_ATTEMPTS = 10
+HOST_BLOCK_FAILURE_RATE = 0.9
+# ... and retried with a single probe once its last failure is this old
+HOST_BLOCK_WINDOW = int(os.getenv("IMAGE_HOST_BLOCK_WINDOW", 6 * 3600))
+# URL -> S3 mappings kept in memory in front of SQLite
+IMAGE_CACHE_MEMORY_SIZE = int(os.getenv("IMAGE_CACHE_MEMORY_SIZE", 10000))
+# Stay below SQLite's bound-parameter limit in IN (...) queries
+SQLITE_BATCH_SIZE = 500
+
+
+def failure_reason(status_code):
+    if status_code in (404, 410):
+        return "not_found"
+    if status_code in (401, 403):
+        return "forbidden"
+    return f"http_{status_code}"
+
 
 class ImageCache:
-    def __init__(self, db_path="image_cache.sqlite3"):
+    """
+    Maps external image URLs to their mirrored S3 objects, and remembers failed downloads
+    (with a backoff expiry) and per-host failure rates so dead images are not refetched.
+    Uses one long-lived WAL connection behind a bounded in-memory LRU; the a* methods run
+    the blocking SQLite work in a thread so the event loop never waits on disk.
+    """
+    def __init__(self, db_path="image_cache.sqlite3", memory_size=None):
         self.db_path = db_path
+        self.memory_size = memory_size or IMAGE_CACHE_MEMORY_SIZE
+        self._memory = OrderedDict()
+        # Counters are summed in memory and written out with the next write or stats() call
+        self._pending_counters = {}
+        self._conn = None
+        # One connection shared across to_thread workers; sqlite3 objects are not thread-safe
+        self._lock = threading.RLock()
         self._init_db()
 
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            # WAL lets the API and the worker read while the other writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        return self._conn
+
     def _init_db(self):
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._lock, self._connect() as conn:
                 conn.execute('''
                     CREATE TABLE IF NOT EXISTS images (
                         original_url TEXT PRIMARY KEY,
@@ -16,27 +77,310 @@ class ImageCache:
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                     )
                 ''')
+                # One row per distinct image body; every URL alias in `images` points at its s3_url
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS blobs (
+                        digest TEXT PRIMARY KEY,
+                        s3_url TEXT NOT NULL,
+                        size INTEGER,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS failures (
+                        original_url TEXT PRIMARY KEY,
+                        host TEXT,
+                        reason TEXT,
+                        attempts INTEGER DEFAULT 0,
+                        retry_at REAL,
+                        failed_at REAL
+                    )
+                ''')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS hosts (
+                        host TEXT PRIMARY KEY,
+                        successes INTEGER DEFAULT 0,
+                        failures INTEGER DEFAULT 0,
+                        last_failure_at REAL
+                    )
+                ''')
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS counters (
+                        name TEXT PRIMARY KEY,
+                        value INTEGER DEFAULT 0
+                    )
+                ''')
         except Exception as e:
             print(f"Error initializing image cache DB: {e}")
 
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    with self._conn as conn:
+                        self._flush_counters(conn)
+                except Exception as e:
+                    print(f"Error saving to image cache DB: {e}")
+                self._conn.close()
+                self._conn = None
+
+    def _bump(self, name, amount=1):
+        self._pending_counters[name] = self._pending_counters.get(name, 0) + amount
+
+    def _flush_counters(self, conn):
+        if not self._pending_counters:
+            return
+        conn.executemany(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            list(self._pending_counters.items())
+        )
+        self._pending_counters = {}
+
+    def _remember(self, original_url, s3_url):
+        self._memory[original_url] = s3_url
+        self._memory.move_to_end(original_url)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get_many(self, original_urls):
+        """
+        Resolves a batch of image URLs in one query. Returns {original_url: s3_url} for the hits.
+        """
+        found = {}
+        missing = []
+        urls = list(dict.fromkeys(u for u in original_urls if u))
+        with self._lock:
+            for url in urls:
+                if url in self._memory:
+                    self._memory.move_to_end(url)
+                    found[url] = self._memory[url]
+                else:
+                    missing.append(url)
+            try:
+                conn = self._connect()
+                for i in range(0, len(missing), SQLITE_BATCH_SIZE):
+                    batch = missing[i:i + SQLITE_BATCH_SIZE]
+                    rows = conn.execute(
+                        f"SELECT original_url, s3_url FROM images WHERE original_url IN ({','.join('?' * len(batch))})",
+                        batch
+                    ).fetchall()
+                    for url, s3_url in rows:
+                        found[url] = s3_url
+                        self._remember(url, s3_url)
+            except Exception as e:
+                print(f"Error reading image cache: {e}")
+            self._bump("hits", len(found))
+            self._bump("misses", len(urls) - len(found))
+        return found
+
+    def put_many(self, mapping):
+        """
+        Saves {original_url: s3_url} pairs in a single transaction.
+        """
+        if not mapping:
+            return
+        with self._lock:
+            try:
+                with self._connect() as conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO images (original_url, s3_url) VALUES (?, ?)",
+                        list(mapping.items())
+                    )
+                    self._flush_counters(conn)
+                for url, s3_url in mapping.items():
+                    self._remember(url, s3_url)
+            except Exception as e:
+                print(f"Error saving to image cache DB: {e}")
+
     def get_s3_url(self, original_url):
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT s3_url FROM images WHERE original_url = ?", (original_url,))
-                row = cursor.fetchone()
-                return row[0] if row else None
-        except Exception:
-            return None
+        return self.get_many([original_url]).get(original_url)
 
     def save_s3_url(self, original_url, s3_url):
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute(
-                    "INSERT OR REPLACE INTO images (original_url, s3_url) VALUES (?, ?)",
-                    (original_url, s3_url)
-                )
-        except Exception as e:
-            print(f"Error saving to image cache DB: {e}")
+        self.put_many({original_url: s3_url})
+
+    def get_s3_url_by_digest(self, digest):
+        with self._lock:
+            try:
+                row = self._connect().execute("SELECT s3_url FROM blobs WHERE digest = ?", (digest,)).fetchone()
+                return row[0] if row else None
+            except Exception:
+                return None
+
+    def save_digest(self, digest, s3_url, size=None):
+        with self._lock:
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO blobs (digest, s3_url, size) VALUES (?, ?, ?)",
+                        (digest, s3_url, size)
+                    )
+            except Exception as e:
+                print(f"Error saving to image cache DB: {e}")
+
+    def get_failures(self, original_urls):
+        """
+        Returns {original_url: reason} for the remembered failures that have not yet expired.
+        """
+        urls = list(dict.fromkeys(u for u in original_urls if u))
+        failures = {}
+        with self._lock:
+            try:
+                conn = self._connect()
+                now = time.time()
+                for i in range(0, len(urls), SQLITE_BATCH_SIZE):
+                    batch = urls[i:i + SQLITE_BATCH_SIZE]
+                    rows = conn.execute(
+                        f"SELECT original_url, reason FROM failures "
+                        f"WHERE original_url IN ({','.join('?' * len(batch))}) AND retry_at > ?",
+                        batch + [now]
+                    ).fetchall()
+                    failures.update(rows)
+            except Exception as e:
+                print(f"Error reading image cache: {e}")
+            self._bump("negative_hits", len(failures))
+        return failures
+
+    def record_failure(self, original_url, reason):
+        """
+        Remembers a failed download; each repeat failure doubles the wait before the next try.
+        Only HTTP and transport failures count towards the host's block rate.
+        """
+        now = time.time()
+        host = urlparse(original_url).netloc.lower()
+        with self._lock:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute("SELECT attempts FROM failures WHERE original_url = ?", (original_url,)).fetchone()
+                    attempts = (row[0] if row else 0) + 1
+                    base = FAILURE_BACKOFF.get(reason, DEFAULT_FAILURE_BACKOFF)
+                    backoff = min(FAILURE_MAX_BACKOFF, base * 2 ** (attempts - 1))
+                    conn.execute(
+                        "INSERT OR REPLACE INTO failures (original_url, host, reason, attempts, retry_at, failed_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (original_url, host, reason, attempts, now + backoff, now)
+                    )
+                    if reason not in CONTENT_FAILURES:
+                        conn.execute(
+                            "INSERT INTO hosts (host, failures, last_failure_at) VALUES (?, 1, ?) "
+                            "ON CONFLICT(host) DO UPDATE SET failures = failures + 1, last_failure_at = excluded.last_failure_at",
+                            (host, now)
+                        )
+                    self._flush_counters(conn)
+            except Exception as e:
+                print(f"Error saving to image cache DB: {e}")
+
+    def record_success(self, original_url):
+        host = urlparse(original_url).netloc.lower()
+        with self._lock:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM failures WHERE original_url = ?", (original_url,))
+                    conn.execute(
+                        "INSERT INTO hosts (host, successes) VALUES (?, 1) "
+                        "ON CONFLICT(host) DO UPDATE SET successes = successes + 1",
+                        (host,)
+                    )
+            except Exception as e:
+                print(f"Error saving to image cache DB: {e}")
+
+    def get_blocked_hosts(self, urls):
+        """
+        Returns the hosts among `urls` that almost always fail (e.g. hotlink protection) and
+        failed recently. Once the block window passes one download goes through as a probe.
+        """
+        hosts = list(dict.fromkeys(urlparse(u).netloc.lower() for u in urls if u))
+        blocked = set()
+        with self._lock:
+            try:
+                conn = self._connect()
+                now = time.time()
+                for i in range(0, len(hosts), SQLITE_BATCH_SIZE):
+                    batch = hosts[i:i + SQLITE_BATCH_SIZE]
+                    rows = conn.execute(
+                        f"SELECT host, successes, failures, last_failure_at FROM hosts "
+                        f"WHERE host IN ({','.join('?' * len(batch))})",
+                        batch
+                    ).fetchall()
+                    for host, successes, failures, last_failure_at in rows:
+                        total = successes + failures
+                        if (
+                            total >= HOST_BLOCK_MIN_ATTEMPTS
+                            and failures / total >= HOST_BLOCK_FAILURE_RATE
+                            and now - (last_failure_at or 0) < HOST_BLOCK_WINDOW
+                        ):
+                            blocked.add(host)
+            except Exception as e:
+                print(f"Error reading image cache: {e}")
+            self._bump("host_skips", sum(1 for u in urls if u and urlparse(u).netloc.lower() in blocked))
+        return blocked
+
+    def lookup_many(self, original_urls):
+        """
+        Everything a batch of downloads needs up front, in one pass: the S3 hits, the
+        unexpired failures of the misses and the blocked hosts of what is left.
+        Returns (cached, failures, blocked_hosts).
+        """
+        with self._lock:
+            cached = self.get_many(original_urls)
+            misses = [u for u in original_urls if u and u not in cached]
+            failures = self.get_failures(misses)
+            blocked_hosts = self.get_blocked_hosts([u for u in misses if u not in failures])
+        return cached, failures, blocked_hosts
+
+    # Async wrappers for use inside the event loop
+    async def aget_many(self, original_urls):
+        return await asyncio.to_thread(self.get_many, list(original_urls))
+
+    async def aput_many(self, mapping):
+        await asyncio.to_thread(self.put_many, dict(mapping))
+
+    async def aget_s3_url_by_digest(self, digest):
+        return await asyncio.to_thread(self.get_s3_url_by_digest, digest)
+
+    async def asave_digest(self, digest, s3_url, size=None):
+        await asyncio.to_thread(self.save_digest, digest, s3_url, size)
+
+    async def arecord_failure(self, original_url, reason):
+        await asyncio.to_thread(self.record_failure, original_url, reason)
+
+    async def arecord_success(self, original_url):
+        await asyncio.to_thread(self.record_success, original_url)
+
+    async def alookup_many(self, original_urls):
+        return await asyncio.to_thread(self.lookup_many, list(original_urls))
+
+    def stats(self):
+        with self._lock:
+            try:
+                with self._connect() as conn:
+                    self._flush_counters(conn)
+                    counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+                    entries = conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+                    failures = dict(conn.execute(
+                        "SELECT reason, COUNT(*) FROM failures WHERE retry_at > ? GROUP BY reason", (time.time(),)
+                    ).fetchall())
+                    worst_hosts = conn.execute(
+                        "SELECT host, successes, failures FROM hosts WHERE failures > 0 "
+                        "ORDER BY failures * 1.0 / (successes + failures) DESC, failures DESC LIMIT 10"
+                    ).fetchall()
+            except Exception:
+                return {}
+            memory_entries = len(self._memory)
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "entries": entries,
+            "memory_entries": memory_entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            "negative_hits": counters.get("negative_hits", 0),
+            "host_skips": counters.get("host_skips", 0),
+            "active_failures": failures,
+            "failing_hosts": [
+                {"host": host, "failures": f, "failure_rate": round(f / (s + f), 3)}
+                for host, s, f in worst_hosts
+            ],
+        }
 
 image_cache = ImageCache()
@@ -22,11 +22,7 @@ async def add_content_to_store(content, metadata):
     import re
 
     # 1. Identify and process the 'Best' image for the entire page
-    _, page_image = await asset_processor.process_raw_content(
-        content, 
-        category=metadata.get("category", "retail"),
-        subcategory=metadata.get("subcategory", "general")
-    )
+    _, page_image = await asset_processor.process_raw_content(content)
     
     text_splitter = get_text_splitter()
     chunks = text_splitter.split_text(content)
@@ -67,11 +63,7 @@ async def add_multiple_contents_to_store(items: list):
         url = item.get("url", "")
         
         # 1. Process images for the ENTIRE product content first
-        _, page_image = await asset_processor.process_raw_content(
-            content, 
-            category=metadata.get("category", "retail"),
-            subcategory=metadata.get("subcategory", "general")
-        )
+        _, page_image = await asset_processor.process_raw_content(content)
 
         # 2. Split the content into chunks
         chunks = text_splitter.split_text(content)
@@ -0,0 +1,191 @@
+import sqlite3
+import hashlib
+import json
+import time
+import uuid
+
+# Jobs in these states count as "in flight" for dedupe purposes
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobContext:
+    """
+    Handed to job handlers so they can report progress and persist resumable checkpoints.
+    """
+    def __init__(self, queue, job):
+        self.queue = queue
+        self.job_id = job["id"]
+        self.checkpoint = job.get("checkpoint")
+
+    async def report_progress(self, progress):
+        self.queue.update_progress(self.job_id, progress)
+
+    async def save_checkpoint(self, checkpoint):
+        self.checkpoint = checkpoint
+        self.queue.save_checkpoint(self.job_id, checkpoint)
+
+
+class JobQueue:
+    """
+    Durable SQLite-backed job queue shared by the API (producer) and worker.py (consumer).
+    Identical in-flight jobs are deduped, and running jobs whose heartbeat went stale
+    (e.g. the worker was killed) are put back in the queue with their checkpoint intact.
+    """
+    def __init__(self, db_path="jobs.sqlite3"):
+        self.db_path = db_path
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        try:
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        id TEXT PRIMARY KEY,
+                        kind TEXT NOT NULL,
+                        payload TEXT NOT NULL,
+                        dedupe_key TEXT,
+                        status TEXT NOT NULL DEFAULT 'queued',
+                        progress TEXT,
+                        checkpoint TEXT,
+                        result TEXT,
+                        error TEXT,
+                        attempts INTEGER DEFAULT 0,
+                        created_at REAL,
+                        updated_at REAL
+                    )
+                ''')
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key, status)")
+        except Exception as e:
+            print(f"Error initializing job queue DB: {e}")
+
+    def _row_to_job(self, row):
+        if row is None:
+            return None
+        job = dict(row)
+        for key in ("payload", "progress", "checkpoint", "result"):
+            job[key] = json.loads(job[key]) if job[key] else None
+        return job
+
+    def enqueue(self, kind, payload, dedupe_key=None):
+        """
+        Adds a job and returns (job_id, deduped). When an identical job is already queued
+        or running, its id is returned instead of creating a new one.
+        """
+        if dedupe_key is None:
+            dedupe_key = hashlib.sha256(f"{kind}:{json.dumps(payload, sort_keys=True)}".encode("utf-8")).hexdigest()
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    f"SELECT id FROM jobs WHERE dedupe_key = ? AND status IN {ACTIVE_STATUSES} LIMIT 1",
+                    (dedupe_key,)
+                ).fetchone()
+                if row:
+                    conn.execute("COMMIT")
+                    return row["id"], True
+                job_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO jobs (id, kind, payload, dedupe_key, status, created_at, updated_at) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                    (job_id, kind, json.dumps(payload), dedupe_key, now, now)
+                )
+                conn.execute("COMMIT")
+                return job_id, False
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def claim(self, kinds=None):
+        """
+        Atomically moves the oldest queued job (optionally restricted to `kinds`) to running.
+        """
+        if kinds is not None and not kinds:
+            return None
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                query = "SELECT * FROM jobs WHERE status = 'queued'"
+                params = []
+                if kinds:
+                    query += f" AND kind IN ({','.join('?' for _ in kinds)})"
+                    params.extend(kinds)
+                row = conn.execute(query + " ORDER BY created_at LIMIT 1", params).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (time.time(), row["id"])
+                )
+                conn.execute("COMMIT")
+                job = self._row_to_job(row)
+                job["status"] = "running"
+                return job
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        try:
+            with self._connect() as conn:
+                conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+        except Exception as e:
+            print(f"Error updating job {job_id}: {e}")
+
+    def heartbeat(self, job_id):
+        self._update(job_id)
+
+    def update_progress(self, job_id, progress):
+        self._update(job_id, progress=json.dumps(progress))
+
+    def save_checkpoint(self, job_id, checkpoint):
+        self._update(job_id, checkpoint=json.dumps(checkpoint))
+
+    def complete(self, job_id, result=None):
+        self._update(job_id, status="done", result=json.dumps(result))
+
+    def fail(self, job_id, error):
+        self._update(job_id, status="failed", error=str(error))
+
+    def requeue_stale(self, timeout=300, max_attempts=3):
+        """
+        Puts running jobs without a recent heartbeat back in the queue (or fails them after
+        max_attempts). Returns the number of jobs recovered.
+        """
+        cutoff = time.time() - timeout
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Too many interrupted attempts' "
+                "WHERE status = 'running' AND updated_at < ? AND attempts >= ?",
+                (cutoff, max_attempts)
+            )
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND updated_at < ?",
+                (cutoff,)
+            )
+            return cursor.rowcount
+
+    def get(self, job_id):
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                job = self._row_to_job(row)
+                if job:
+                    # Checkpoints are internal resume state, not part of the public status
+                    job.pop("checkpoint", None)
+                    job.pop("dedupe_key", None)
+                return job
+        except Exception:
+            return None
+
+
+job_queue = JobQueue()
@@ -2,11 +2,20 @@ import os
 import json
 import asyncio
 import re
+import time
+import copy
 import aiohttp
-from urllib.parse import urljoin, urlparse
-from anthropic import AsyncAnthropic
+from urllib.parse import urljoin, urlparse, quote_plus
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
-from crawl4ai import AsyncWebCrawler
+from browser_pool import browser_pool
+from http_fetcher import http_fetcher
+from extraction_cache import extraction_cache
+from structured_data import extract_structured_products, is_complete
+from wrapper_induction import wrapper_induction
+from discovery import category_keywords
+from content_condenser import condense, estimate_tokens
+from rate_limiter import llm_limiter, is_rate_limit_error, FOREGROUND, BACKGROUND
 
 load_dotenv()
 
@@ -22,13 +31,47 @@ No explanation.
 If missing → null.
 """
 
+# Source pages crawled and extracted at once during background enrichment
+DEEP_CRAWL_CONCURRENCY = int(os.getenv("DEEP_CRAWL_CONCURRENCY", 5))
+
+# Bing image results are reused for this long per cleaned query
+IMAGE_SEARCH_TTL = int(os.getenv("IMAGE_SEARCH_TTL", 1800))
+IMAGE_SEARCH_CACHE_SIZE = 256
+
+
+def filter_by_category(products, target_category):
+    """
+    Keeps products whose name, brand, details or URL mention the target category or query,
+    the check the extraction prompt applies for LLM results. Generic categories keep all.
+    """
+    keywords = category_keywords(target_category)
+    if not keywords:
+        return products
+    kept = []
+    for p in products:
+        text = " ".join(str(p.get(k) or "") for k in ("name", "brand", "details", "url")).lower()
+        if any(k in text for k in keywords):
+            kept.append(p)
+    return kept
+
+
+# Bump whenever the extraction prompt changes so cached extractions are not reused
+EXTRACTION_PROMPT_VERSION = 1
+
 class KimiService:
     def __init__(self):
         self.api_key = os.getenv("MOONSHOT_API_KEY")
-        self.client = AsyncAnthropic(api_key=self.api_key)
+        # Retries are owned by _call_with_retry/llm_limiter, and every response's rate-limit
+        # headers are fed to the limiter so it tracks the provider's real budget
+        self.client = AsyncAnthropic(
+            api_key=self.api_key,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(event_hooks={"response": [llm_limiter.observe_response]})
+        )
         self.model = "claude-3-haiku-20240307"
-        # Increase semaphore to allow more parallel extraction
-        self.semaphore = asyncio.Semaphore(4)
+        # cleaned query -> (expires_at, result) and cleaned query -> in-flight fetch task
+        self._image_search_cache = {}
+        self._image_search_inflight = {}
         self.base_retail_domains = [
             "amazon.com", "amazon.in", "flipkart.com", "ebay.com"
         ]
@@ -80,7 +123,8 @@ Return ONLY valid JSON with these fields (never return null — use "N/A" if unk
                     max_tokens=300,
                     system=EXTRACTION_SYSTEM_PROMPT,
                     messages=[{"role": "user", "content": prompt}],
-                )
+                ),
+                foreground=True, est_tokens=estimate_tokens(prompt) + 300
             )
             if not response:
                 return await self.search_images(query)
@@ -97,74 +141,108 @@ Return ONLY valid JSON with these fields (never return null — use "N/A" if unk
             print("Vehicle error:", e)
             return await self.search_images(query)
 
-    async def search_images(self, query):
-        # 1. Smarter query cleaning: Remove filler words
+    def _clean_image_query(self, query):
+        # Smarter query cleaning: Remove filler words
         fillers = ["show me", "some", "images", "image", "of", "find", "search", "get", "pics", "pictures", "photos"]
         clean_query = query.lower()
         for f in fillers:
             clean_query = clean_query.replace(f, "")
-        clean_query = clean_query.strip()
+        clean_query = " ".join(clean_query.split())
+        return clean_query or query
+
+    async def search_images(self, query):
+        """
+        Bing image results for the query, served from a TTL cache when possible.
+        Concurrent calls for the same cleaned query share a single fetch.
+        """
+        clean_query = self._clean_image_query(query)
+
+        cached = self._image_search_cache.get(clean_query)
+        if cached and cached[0] > time.time():
+            print(f"DEBUG: Image search cache hit for: {clean_query}")
+            return copy.deepcopy(cached[1])
+
+        task = self._image_search_inflight.get(clean_query)
+        if task is None:
+            task = asyncio.create_task(self._fetch_bing_images(clean_query))
+            self._image_search_inflight[clean_query] = task
+            task.add_done_callback(lambda _: self._image_search_inflight.pop(clean_query, None))
+        else:
+            print(f"DEBUG: Joining in-flight image search for: {clean_query}")
+        # Shielded so one caller giving up does not cancel the fetch for the others
+        result = await asyncio.shield(task)
+        return copy.deepcopy(result)
+
+    def _parse_bing_images(self, html_content, clean_query):
+        # Extract both thumbnail URL (turl) and page URL (purl)
+        # Bing encodes JSON in data-m attribute - we want TURL (Bing Proxy) not MURL (Source blockable CDN)
+        # Use flexible independent extraction as order can vary
+        turls = re.findall(r'turl&quot;:&quot;(https?://.*?)&quot;', html_content)
+        purls = re.findall(r'purl&quot;:&quot;(https?://.*?)&quot;', html_content)
         
-        if not clean_query: clean_query = query # Fallback
+        blocks = []
+        for t, p in zip(turls, purls):
+            # Decode HTML entities like &amp; in URLs
+            t = t.replace("&amp;", "&")
+            p = p.replace("&amp;", "&")
+            blocks.append((t, p))
 
+        # Deduplicate and filter
+        real_results = []
+        seen = set()
+        for img_url, pg_url in blocks:
+            if img_url.startswith("//"): img_url = "https:" + img_url
+            if pg_url.startswith("//"): pg_url = "https:" + pg_url
+            
+            if not img_url.startswith("http"): continue
+            # Filter out potential internal/junk URLs
+            if any(x in img_url for x in ["bing.com", "google.com", "gstatic.com", "microsoft.com"]): continue
+            if img_url in seen: continue
+            seen.add(img_url)
+            
+            real_results.append({
+                "name": f"{clean_query} {len(real_results) + 1}",
+                "image_url": img_url,
+                "source_url": pg_url
+            })
+            if len(real_results) >= 10: break
+        return real_results
+
+    async def _fetch_bing_images(self, clean_query):
         print(f"DEBUG: Starting image search for: {clean_query}")
-        # Try to find real images using the crawler
+        # Bing search often has easier to scrape image URLs
+        search_url = f"https://www.bing.com/images/search?q={quote_plus(clean_query)}"
+        real_results = []
         try:
-            # Bing search often has easier to scrape image URLs
-            search_url = f"https://www.bing.com/images/search?q={clean_query.replace(' ', '+')}"
-            
-            async with AsyncWebCrawler() as crawler:
-                result = await crawler.arun(url=search_url)
-                if result.success:
-                    import re
-                    html_content = result.html
-                    
-                    # Extract both thumbnail URL (turl) and page URL (purl)
-                    # Bing encodes JSON in data-m attribute - we want TURL (Bing Proxy) not MURL (Source blockable CDN)
-                    # Use flexible independent extraction as order can vary
-                    turls = re.findall(r'turl&quot;:&quot;(https?://.*?)&quot;', html_content)
-                    purls = re.findall(r'purl&quot;:&quot;(https?://.*?)&quot;', html_content)
-                    
-                    blocks = []
-                    for t, p in zip(turls, purls):
-                        # Decode HTML entities like &amp; in URLs
-                        t = t.replace("&amp;", "&")
-                        p = p.replace("&amp;", "&")
-                        blocks.append((t, p))
-
-                    # Deduplicate and filter
-                    real_results = []
-                    seen = set()
-                    for img_url, pg_url in blocks:
-                        if img_url.startswith("//"): img_url = "https:" + img_url
-                        if pg_url.startswith("//"): pg_url = "https:" + pg_url
-                        
-                        if not img_url.startswith("http"): continue
-                        # Filter out potential internal/junk URLs
-                        if any(x in img_url for x in ["bing.com", "google.com", "gstatic.com", "microsoft.com"]): continue
-                        if img_url in seen: continue
-                        seen.add(img_url)
-                        
-                        real_results.append({
-                            "name": f"{clean_query} {len(real_results) + 1}",
-                            "image_url": img_url,
-                            "source_url": pg_url
-                        })
-                        if len(real_results) >= 10: break
-                    
-                    if real_results:
-                        print(f"DEBUG: Found {len(real_results)} real images with source URLs from Bing.")
-                        return {
-                            "type": "images",
-                            "query": clean_query,
-                            "results": real_results
-                        }
-                    else:
-                        print("DEBUG: No real images found in Bing search result.")
+            # The turl/purl data is in the server-rendered HTML, so a plain GET usually suffices
+            response = await http_fetcher.get_raw(search_url)
+            if response is not None and response.status_code == 200:
+                real_results = self._parse_bing_images(response.text, clean_query)
+            if not real_results:
+                print("DEBUG: HTTP image search found nothing, falling back to browser")
+                async with browser_pool.lease() as crawler:
+                    result = await crawler.arun(url=search_url)
+                    browser_pool.report_result(crawler, result.success)
+                    if result.success:
+                        real_results = self._parse_bing_images(result.html, clean_query)
         except Exception as e:
             print(f"Image search error: {e}")
 
-        # Final fallback to working placeholder
+        if real_results:
+            print(f"DEBUG: Found {len(real_results)} real images with source URLs from Bing.")
+            result = {
+                "type": "images",
+                "query": clean_query,
+                "results": real_results
+            }
+            if len(self._image_search_cache) >= IMAGE_SEARCH_CACHE_SIZE:
+                oldest = min(self._image_search_cache, key=lambda k: self._image_search_cache[k][0])
+                del self._image_search_cache[oldest]
+            self._image_search_cache[clean_query] = (time.time() + IMAGE_SEARCH_TTL, result)
+            return result
+        print("DEBUG: No real images found in Bing search result.")
+
+        # Final fallback to working placeholder (not cached, so the next call retries Bing)
         return {
             "type": "images",
             "query": clean_query,
@@ -172,12 +250,12 @@ Return ONLY valid JSON with these fields (never return null — use "N/A" if unk
                 {
                     "name": f"{clean_query} 1",
                     "image_url": f"https://placehold.co/800x600?text={clean_query.replace(' ', '+')}+1",
-                    "source_url": f"https://www.bing.com/images/search?q={clean_query.replace(' ', '+')}"
+                    "source_url": search_url
                 },
                 {
                     "name": f"{clean_query} 2",
                     "image_url": f"https://placehold.co/800x600?text={clean_query.replace(' ', '+')}+2",
-                    "source_url": f"https://www.bing.com/images/search?q={clean_query.replace(' ', '+')}"
+                    "source_url": search_url
                 }
             ]
         }
@@ -220,41 +298,81 @@ Return ONLY valid JSON with these fields (never return null — use "N/A" if unk
         return fast_results
 
     async def run_deep_crawl_process(self, query, fast_bing_products):
+        """
+        Crawls and extracts the fast results' source pages. Returns (products, page_updates);
+        page_updates are (page, products) pairs to record in page_state once the products
+        have been stored, so a failed ingestion is retried on the next crawl.
+        """
         print(f"DEBUG: Starting background run_deep_crawl_process for {query}")
-        urls = [p["source_url"] for p in fast_bing_products if p.get("source_url")]
+        urls = list(dict.fromkeys(p["source_url"] for p in fast_bing_products if p.get("source_url")))
         
         results = []
+        reused = []
+        crawled_pages = []
         if urls:
-            print(f"DEBUG: Found {len(urls)} URLs. Starting advanced crawl for visibility...")
-            pages = []
-            from crawler import crawl_site
-            async with AsyncWebCrawler() as crawler:
-                for idx, url in enumerate(urls):
+            print(f"DEBUG: Found {len(urls)} URLs. Starting parallel crawl + extraction (concurrency {DEEP_CRAWL_CONCURRENCY})...")
+            from crawler import fetch_page
+            from crawl_scheduler import crawl_scheduler
+            from page_state import page_state
+            semaphore = asyncio.Semaphore(DEEP_CRAWL_CONCURRENCY)
+            # Keyed by source URL, so a failed crawl can never shift products onto another page
+            outcomes = {}
+
+            async def crawl_and_extract(idx, url):
+                async with semaphore:
                     print(f"🚀 [CRAWL] ({idx+1}/{len(urls)}) -> {url}")
-                    content, _ = await crawl_site(url, crawler=crawler)
-                    if content:
-                        pages.append(content)
-            
-            print(f"✅ [COMPLETE] Crawled {len(pages)} product pages successfully.")
+                    try:
+                        async with crawl_scheduler.slot(url):
+                            page = await fetch_page(url, conditional=True)
+                    except Exception as e:
+                        print(f"Error crawling {url}: {e}")
+                        return
+                if not page or crawl_scheduler.report(url, page.get("status"), page.get("content"),
+                                                      retry_after=page.get("retry_after")):
+                    return
+                extraction = page_state.get_extraction(url, query) if page.get("unchanged") else None
+                if extraction is not None:
+                    # Unchanged since the last crawl: reuse its products, skip LLM/S3/ingestion
+                    for p in extraction:
+                        p["unchanged"] = True
+                    outcomes[url] = (page, extraction, True)
+                    return
+                if page.get("unchanged") and not page.get("content"):
+                    # 304, but the stored products were extracted for another query
+                    try:
+                        async with semaphore, crawl_scheduler.slot(url):
+                            page = await fetch_page(url)
+                    except Exception as e:
+                        print(f"Error crawling {url}: {e}")
+                        return
+                    if not page:
+                        return
+                content = page.get("content") or ""
+                if len(content) < 200:
+                    return
+                # Extract as soon as this page lands; the freed crawl slot picks up the next URL
+                # Markdown is condensed to a token budget inside extract_product_data
+                products = await self.extract_product_data(content, query, base_url=url, html=page.get("html")) or []
+                for p in products:
+                    if not p.get("url") and not p.get("source_url"):
+                        p["source_url"] = url
+                outcomes[url] = (page, products, False)
 
-            print(f"DEBUG: Fetched {len(pages)} pages. Starting parallel extraction...")
-            extraction_tasks = []
-            for idx, content in enumerate(pages):
-                if not content or len(content) < 200: continue
-                source_url = urls[idx] if idx < len(urls) else query
-                
-                clean = re.sub(r"<script.*?</script>", "", content, flags=re.DOTALL)
-                clean = re.sub(r"<style.*?</style>", "", clean, flags=re.DOTALL)
-                clean = re.sub(r"<[^>]+>", " ", clean)
-                extraction_tasks.append(self.extract_product_data(clean, query, base_url=source_url))
-            
-            if extraction_tasks:
-                extracted_batches = await asyncio.gather(*extraction_tasks)
-                for batch in extracted_batches:
-                    results.extend(batch)
+            await asyncio.gather(*(crawl_and_extract(idx, url) for idx, url in enumerate(urls)))
+
+            for url in urls:
+                if url not in outcomes:
+                    continue
+                page, products, was_reused = outcomes[url]
+                if was_reused:
+                    reused.extend(products)
+                else:
+                    crawled_pages.append((page, products))
+                    results.extend(products)
+            print(f"✅ [COMPLETE] Extracted {len(crawled_pages)} changed product pages ({len(reused)} products reused from unchanged pages).")
 
         # Fallback to the fast_bing_products for any URLs that failed to extract
-        extracted_source_urls = [p.get("source_url") or p.get("url") for p in results]
+        extracted_source_urls = [p.get("source_url") or p.get("url") for p in results + reused]
         extracted_source_urls = [self._normalize_url(u) for u in extracted_source_urls if u]
         
         for fast_p in fast_bing_products:
@@ -268,35 +386,89 @@ Return ONLY valid JSON with these fields (never return null — use "N/A" if unk
         from asset_processor import asset_processor
         if results:
             print(f"DEBUG: Processing {len(results)} extracted products for S3 upload and filtering...")
-            results = asset_processor.process_product_images(results, category="retail", subcategory="live_search")
+            results = await asset_processor.process_product_images(results)
             # process_product_images modifies dictionaries in place and adds s3_image_url
             for p in results:
                 if p.get("s3_image_url"):
                     p["image_url"] = p["s3_image_url"] # Ensure the primary image_url is the S3 one
 
+        results.extend(reused)
+        results = results[:10]
         print(f"DEBUG: Finished get_product_data. Total combined items: {len(results)}")
-        return results[:10]
+        # What each changed page produced (and is about to be stored), so the next crawl can skip it
+        kept = {id(p) for p in results}
+        page_updates = [(page, [p for p in batch if id(p) in kept]) for page, batch in crawled_pages]
+        return results, page_updates
 
-    async def extract_product_data(self, content, target_category="relevant", base_url=None):
-        truncated_content = content[:15000]
+    async def extract_product_data(self, content, target_category="relevant", base_url=None, html=None):
+        # Schema.org / OpenGraph data in the raw HTML is free and exact: only fall back
+        # to the LLM when it is missing or lacks a name, price or image
+        structured = []
+        if html:
+            try:
+                structured = await asyncio.to_thread(extract_structured_products, html, base_url)
+            except Exception as e:
+                print(f"Structured data extraction error: {e}")
+            # Structured data lists every product on the page; the LLM prompt would have filtered
+            structured = filter_by_category(structured, target_category)
+            if structured and all(is_complete(p) for p in structured):
+                print(f"DEBUG: Structured data gave {len(structured)} complete products, skipping LLM call")
+                return structured
+
+        # Next cheapest: a selector template learned from earlier LLM extractions on this domain
+        template_product = None
+        if html and base_url:
+            try:
+                template_product = await asyncio.to_thread(wrapper_induction.apply, html, base_url)
+            except Exception as e:
+                print(f"Wrapper template error: {e}")
+            if template_product and not filter_by_category([template_product], target_category):
+                template_product = None
+            if template_product and not wrapper_induction.should_validate():
+                print(f"DEBUG: Wrapper template matched {base_url}, skipping LLM call")
+                return [template_product]
+
+        truncated_content = condense(content)
+        print(f"DEBUG: Condensed content {estimate_tokens(content)} -> {estimate_tokens(truncated_content)} tokens")
+        if not truncated_content.strip():
+            print("DEBUG: No page text left to extract from, skipping LLM call")
+            return structured
         prompt = (
             f"Extract products matching '{target_category}' from the text.\n"
             f"Return a JSON list of objects with: name, price, brand, image_url, url.\n"
             f"Text:\n{truncated_content}"
         )
         try:
-            print(f"DEBUG: Extraction LLM call start (content length: {len(truncated_content)})")
-            response = await self._call_with_retry(
-                lambda: self.client.messages.create(
-                    model=self.model,
-                    max_tokens=1000,
-                    system="Return ONLY valid JSON list named 'products'.",
-                    messages=[{"role": "user", "content": prompt}],
+            cache_key = extraction_cache.make_key(truncated_content, target_category, EXTRACTION_PROMPT_VERSION, self.model)
+            extracted = await extraction_cache.aget(cache_key)
+            if extracted is not None:
+                print(f"DEBUG: Extraction cache hit ({len(extracted)} products), skipping LLM call")
+            else:
+                print(f"DEBUG: Extraction LLM call start (content length: {len(truncated_content)})")
+                response = await self._call_with_retry(
+                    lambda: self.client.messages.create(
+                        model=self.model,
+                        max_tokens=1000,
+                        system="Return ONLY valid JSON list named 'products'.",
+                        messages=[{"role": "user", "content": prompt}],
+                    ),
+                    est_tokens=estimate_tokens(prompt) + 1000
                 )
-            )
-            if not response: return []
-            data = self._safe_json_parse(response.content[0].text, "products")
-            extracted = data if isinstance(data, list) else data.get("products", [])
+                if not response: return structured
+                data = self._safe_json_parse(response.content[0].text, "products")
+                extracted = data if isinstance(data, list) else (data.get("products") if isinstance(data, dict) else None)
+                if not isinstance(extracted, list):
+                    extracted = []
+                extracted = [p for p in extracted if isinstance(p, dict)]
+                usage = getattr(response, "usage", None)
+                tokens = (usage.input_tokens + usage.output_tokens) if usage else 0
+                if getattr(response, "stop_reason", None) == "max_tokens":
+                    # Truncated JSON: use what parsed, but let the next crawl try again
+                    print("DEBUG: Extraction answer hit max_tokens, not caching it")
+                else:
+                    # Cached before URL normalization so the entry is valid for any base_url.
+                    # put() drops empty results, which are usually parse failures
+                    await extraction_cache.aput(cache_key, extracted, tokens=tokens)
             
             # NORMALIZE URLs using base_url
             if base_url:
@@ -308,10 +480,17 @@ Return ONLY valid JSON with these fields (never return null — use "N/A" if unk
                     elif p.get("source_url"):
                         p["source_url"] = urljoin(base_url, p["source_url"])
             
-            return extracted
+            if html and base_url and extracted:
+                try:
+                    await asyncio.to_thread(wrapper_induction.learn, html, base_url, extracted, template_product)
+                except Exception as e:
+                    print(f"Wrapper induction error: {e}")
+
+            # Partial structured data still beats an empty LLM answer
+            return extracted or structured
         except Exception as e:
             print(f"Extraction error: {e}")
-            return []
+            return structured
 
     async def live_search(self, query):
         prompt = f"Give a helpful answer for: {query}"
@@ -323,7 +502,8 @@ Return ONLY valid JSON with these fields (never return null — use "N/A" if unk
                     max_tokens=500,
                     system=SYSTEM_PROMPT,
                     messages=[{"role": "user", "content": prompt}],
-                )
+                ),
+                foreground=True, est_tokens=estimate_tokens(prompt) + 500
             )
             return response.content[0].text if response else "No result found."
         except Exception as e:
@@ -341,7 +521,8 @@ Return ONLY valid JSON with these fields (never return null — use "N/A" if unk
                     max_tokens=300,
                     system=system_msg,
                     messages=[{"role": "user", "content": prompt}],
-                )
+                ),
+                foreground=True, est_tokens=estimate_tokens(prompt) + 300
             )
             if not response: return []
             text = response.content[0].text
@@ -386,17 +567,24 @@ Return ONLY valid JSON with these fields (never return null — use "N/A" if unk
                 pass
             return {key: []}
 
-    async def _call_with_retry(self, func_factory, retries=3):
+    async def _call_with_retry(self, func_factory, retries=3, foreground=False, est_tokens=1000):
+        """
+        Runs an LLM call through the shared adaptive limiter. Foreground (user-facing) calls
+        are scheduled ahead of background extraction; rate-limit waits are handled by the limiter.
+        """
+        priority = FOREGROUND if foreground else BACKGROUND
         for i in range(retries):
             try:
-                async with self.semaphore:
-                    return await func_factory()
+                async with llm_limiter.slot(priority, tokens=est_tokens) as lease:
+                    response = await func_factory()
+                    usage = getattr(response, "usage", None)
+                    if usage:
+                        lease.tokens = usage.input_tokens + usage.output_tokens
+                    return response
             except Exception as e:
-                is_rate_limit = "429" in str(e) or "rate_limit" in str(e).lower()
-                if is_rate_limit and i < retries - 1:
-                    wait_time = (5 ** i) + 2
-                    print(f"Rate limited. Waiting {wait_time}s...")
-                    await asyncio.sleep(wait_time)
+                if is_rate_limit_error(e) and i < retries - 1:
+                    # The limiter has already paused for retry-after and cut concurrency
+                    print("Rate limited. Retrying after limiter backoff...")
                 elif i == retries - 1:
                     print(f"LLM call failed after {retries} retries: {e}")
                     return None
@@ -407,9 +595,10 @@ Return ONLY valid JSON with these fields (never return null — use "N/A" if unk
     async def cache_and_store_products(self, products, query):
         """
         Background task to ingest live product data into the local vector store.
+        Returns False when ingestion failed.
         """
         if not products:
-            return
+            return True
 
         print(f"\n🚀 [BACKGROUND] Starting caching for: {query}")
         print(f"📦 [BACKGROUND] Processing {len(products)} products...")
@@ -419,6 +608,9 @@ Return ONLY valid JSON with these fields (never return null — use "N/A" if unk
             
             ingest_items = []
             for product in products:
+                # Products reused from unchanged pages are already in the vector store
+                if product.get("unchanged"):
+                    continue
                 # Basic description formatting for RAG
                 # We normalize keys to ensure compatibility with ingest.py
                 source_url = product.get('source_url') or product.get('url') or "unknown"
@@ -454,8 +646,9 @@ Return ONLY valid JSON with these fields (never return null — use "N/A" if unk
             if ingest_items:
                 await add_multiple_contents_to_store(ingest_items)
                 print(f"✅ [BACKGROUND] Successfully cached {len(ingest_items)} products for '{query}'\n")
-            
+            return True
         except Exception as e:
             print(f"❌ [BACKGROUND] Error during caching: {e}")
+            return False
 
 kimi_service = KimiService()
\ No newline at end of file
@@ -1,6 +1,10 @@
 import asyncio
 import sys
 from retail_crawler import retail_crawler
+from browser_pool import browser_pool
+from http_fetcher import http_fetcher
+from asset_processor import asset_processor
+from image_cache import image_cache
 
 async def run_manual_sync(url, category=None):
     """
@@ -19,7 +23,6 @@ async def run_manual_sync(url, category=None):
         
         if results:
             print(f"\n✅ SUCCESS: Synced {len(results)} products.")
-            print(f"Images have been uploaded to S3 with categorization.")
             for i, p in enumerate(results[:5]):
                 print(f" [{i+1}] {p.get('name')} | Image: {p.get('image_url')}")
             if len(results) > 5:
@@ -31,6 +34,12 @@ async def run_manual_sync(url, category=None):
         print(f"\n❌ ERROR during manual sync: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        # Chromium instances and HTTP clients would otherwise outlive the event loop
+        await browser_pool.close()
+        await http_fetcher.close()
+        await asset_processor.close()
+        image_cache.close()
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -0,0 +1,143 @@
+import sqlite3
+import hashlib
+import json
+import re
+from frontier import canonicalize_url
+
+
+def content_hash(markdown):
+    """
+    Stable hash of page markdown, insensitive to whitespace and case changes.
+    """
+    normalized = re.sub(r"\s+", " ", (markdown or "")).strip().lower()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def _normalize_category(category):
+    return (category or "").strip().lower()
+
+
+class PageStateStore:
+    """
+    Remembers what each crawled page looked like the last time it was fully processed:
+    HTTP validators, a hash of the markdown, its internal links and the extraction result.
+    Lets re-syncs skip extraction, image mirroring and ingestion for unchanged pages.
+    """
+    def __init__(self, db_path="page_state.sqlite3"):
+        self.db_path = db_path
+        self._init_db()
+
+    def _init_db(self):
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS page_state (
+                        canonical_url TEXT PRIMARY KEY,
+                        etag TEXT,
+                        last_modified TEXT,
+                        content_hash TEXT,
+                        links TEXT,
+                        extraction TEXT,
+                        extraction_category TEXT,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(page_state)")}
+                if "extraction_category" not in columns:
+                    # Databases from before extractions were scoped to a category
+                    conn.execute("ALTER TABLE page_state ADD COLUMN extraction_category TEXT")
+        except Exception as e:
+            print(f"Error initializing page state DB: {e}")
+
+    def get(self, url):
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT etag, last_modified, content_hash, links, extraction, extraction_category "
+                    "FROM page_state WHERE canonical_url = ?",
+                    (canonicalize_url(url),)
+                )
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                return {
+                    "etag": row[0],
+                    "last_modified": row[1],
+                    "content_hash": row[2],
+                    "links": json.loads(row[3]) if row[3] else [],
+                    "extraction": json.loads(row[4]) if row[4] else None,
+                    "extraction_category": row[5],
+                }
+        except Exception:
+            return None
+
+    def get_extraction(self, url, category):
+        """
+        Returns the products stored for a page, but only when they were extracted for the
+        same target category (or query); another category needs a fresh extraction.
+        """
+        state = self.get(url)
+        if not state or state["extraction"] is None:
+            return None
+        if state["extraction_category"] != _normalize_category(category):
+            return None
+        return state["extraction"]
+
+    def save(self, url, page, products=None, category=None):
+        """
+        Records a page as fully processed. Call only after its downstream work succeeded,
+        otherwise a failed run would be skipped as 'unchanged' next time.
+        `category` is the target category or query the products were extracted for.
+        Without products (plain ingestion) a stored extraction is kept while the content
+        hash is the same, so a sync can still reuse it.
+        """
+        validators = page.get("validators") or {}
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    """INSERT INTO page_state
+                       (canonical_url, etag, last_modified, content_hash, links, extraction,
+                        extraction_category, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                       ON CONFLICT(canonical_url) DO UPDATE SET
+                           etag = excluded.etag,
+                           last_modified = excluded.last_modified,
+                           links = excluded.links,
+                           extraction = CASE
+                               WHEN excluded.extraction IS NOT NULL THEN excluded.extraction
+                               WHEN page_state.content_hash = excluded.content_hash THEN page_state.extraction
+                           END,
+                           extraction_category = CASE
+                               WHEN excluded.extraction IS NOT NULL THEN excluded.extraction_category
+                               WHEN page_state.content_hash = excluded.content_hash THEN page_state.extraction_category
+                           END,
+                           content_hash = excluded.content_hash,
+                           updated_at = CURRENT_TIMESTAMP""",
+                    (
+                        canonicalize_url(url),
+                        validators.get("etag"),
+                        validators.get("last_modified"),
+                        page.get("content_hash"),
+                        json.dumps(page.get("links") or []),
+                        json.dumps(products) if products is not None else None,
+                        _normalize_category(category) if products is not None else None,
+                    )
+                )
+        except Exception as e:
+            print(f"Error saving page state for {url}: {e}")
+
+    def clear(self):
+        """
+        Forgets every page, so the next crawl re-fetches and re-ingests everything.
+        Must accompany any wipe of the vector store.
+        """
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("DELETE FROM page_state")
+            print("Page state cleared.")
+        except Exception as e:
+            print(f"Error clearing page state: {e}")
+
+
+page_state = PageStateStore()
@@ -0,0 +1,218 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Lower runs first: user-facing /chat calls jump ahead of background extraction
+FOREGROUND = 0
+BACKGROUND = 1
+
+RATE_LIMIT_STATUSES = {429, 529}
+WINDOW_SECONDS = 60.0
+
+
+def is_rate_limit_error(error):
+    if getattr(error, "status_code", None) in RATE_LIMIT_STATUSES:
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate_limit" in message or "rate limit" in message or "overloaded" in message
+
+
+def _seconds_until(value):
+    """
+    Parses a retry-after style value: delta seconds, an HTTP date or an RFC 3339 timestamp.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    for parse in (parsedate_to_datetime, lambda v: datetime.fromisoformat(v.replace("Z", "+00:00"))):
+        try:
+            moment = parse(value)
+            if moment.tzinfo is None:
+                moment = moment.replace(tzinfo=timezone.utc)
+            return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def retry_after_from_headers(headers):
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    return _seconds_until(headers.get("retry-after"))
+
+
+class _Lease:
+    def __init__(self, tokens):
+        # Callers overwrite this with the real usage once the response arrives
+        self.tokens = tokens
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limiter for LLM calls.
+    Stays inside a requests/tokens-per-minute budget (adopting the provider's limits when its
+    headers report them), grows concurrency by one per clean round and halves it on a rate
+    limit (AIMD), honors retry-after, and always serves foreground waiters first.
+    """
+    def __init__(self, rpm=None, tpm=None, initial_concurrency=None, max_concurrency=None, min_concurrency=1):
+        self.rpm = rpm or int(os.getenv("LLM_RPM", 50))
+        self.tpm = tpm or int(os.getenv("LLM_TPM", 50000))
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+        self.min_concurrency = min_concurrency
+        self.concurrency = initial_concurrency or int(os.getenv("LLM_INITIAL_CONCURRENCY", 4))
+        # Slots background calls may never take, so a /chat call never queues behind extraction
+        self.foreground_reserve = 1
+        self.active = 0
+        self.blocked_until = 0.0
+        self._window = deque()
+        self._successes = 0
+        self._strikes = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._condition = None
+        self.stats_counters = {"requests": 0, "throttled": 0, "foreground": 0, "background": 0}
+
+    def _prune(self, now):
+        while self._window and now - self._window[0][0] > WINDOW_SECONDS:
+            self._window.popleft()
+
+    def _window_tokens(self):
+        return sum(lease.tokens for _, lease in self._window)
+
+    def _can_start(self, priority, tokens, now):
+        if now < self.blocked_until:
+            return False
+        limit = self.concurrency
+        if priority == BACKGROUND and self.concurrency > self.foreground_reserve:
+            limit -= self.foreground_reserve
+        if self.active >= limit or len(self._window) >= self.rpm:
+            return False
+        # One oversized request is still allowed through an otherwise empty window
+        return not self._window or self._window_tokens() + tokens <= self.tpm
+
+    def _wait_time(self, now, tokens=0):
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        # Budget checks mirror _can_start: only the window's oldest entry expiring frees room,
+        # and no finishing call would notify us about that
+        if self._window and (len(self._window) >= self.rpm or self._window_tokens() + tokens > self.tpm):
+            return max(0.05, self._window[0][0] + WINDOW_SECONDS - now)
+        # Otherwise a finishing call will wake us
+        return None
+
+    @asynccontextmanager
+    async def slot(self, priority=BACKGROUND, tokens=0):
+        """
+        Waits for budget and a concurrency slot, then holds it for the block.
+        A rate-limit error escaping the block shrinks concurrency and pauses all callers.
+        """
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        lease = _Lease(tokens)
+        entry = (priority, next(self._seq))
+        async with self._condition:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._prune(now)
+                    if self._waiters[0] == entry and self._can_start(priority, tokens, now):
+                        break
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), timeout=self._wait_time(now, tokens))
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+            self.active += 1
+            self._window.append((time.monotonic(), lease))
+            self.stats_counters["requests"] += 1
+            self.stats_counters["foreground" if priority == FOREGROUND else "background"] += 1
+
+        try:
+            yield lease
+        except Exception as e:
+            if is_rate_limit_error(e):
+                response = getattr(e, "response", None)
+                self._on_rate_limited(retry_after_from_headers(getattr(response, "headers", None)))
+            raise
+        else:
+            self._on_success()
+        finally:
+            async with self._condition:
+                self.active -= 1
+                self._condition.notify_all()
+
+    def _on_success(self):
+        self._strikes = 0
+        self._successes += 1
+        # Additive increase: one more slot after a full round of clean calls
+        if self._successes >= self.concurrency and self.concurrency < self.max_concurrency:
+            self.concurrency += 1
+            self._successes = 0
+
+    def _on_rate_limited(self, retry_after=None):
+        self._strikes += 1
+        self._successes = 0
+        self.stats_counters["throttled"] += 1
+        # Multiplicative decrease
+        self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+        backoff = retry_after if retry_after is not None else min(60.0, 2 ** self._strikes)
+        self.blocked_until = max(self.blocked_until, time.monotonic() + backoff)
+        print(f"⚠️ [LLM LIMITER] Rate limited. Concurrency -> {self.concurrency}, pausing {backoff:.1f}s")
+
+    def update_from_headers(self, headers):
+        """
+        Adopts the provider's advertised limits and pauses early when a budget is exhausted.
+        Understands Anthropic (anthropic-ratelimit-*) and OpenAI-style (x-ratelimit-*) headers.
+        """
+        for prefix, limit_attr in (("requests", "rpm"), ("tokens", "tpm")):
+            limit = headers.get(f"anthropic-ratelimit-{prefix}-limit") or headers.get(f"x-ratelimit-limit-{prefix}")
+            remaining = headers.get(f"anthropic-ratelimit-{prefix}-remaining") or headers.get(f"x-ratelimit-remaining-{prefix}")
+            reset = headers.get(f"anthropic-ratelimit-{prefix}-reset") or headers.get(f"x-ratelimit-reset-{prefix}")
+            try:
+                if limit:
+                    setattr(self, limit_attr, max(1, int(limit)))
+                if remaining is not None and int(remaining) <= 0:
+                    wait = _seconds_until(reset) or retry_after_from_headers(headers) or 1.0
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + wait)
+            except ValueError:
+                continue
+
+    async def observe_response(self, response):
+        """
+        httpx response event hook; sees the rate-limit headers of every LLM response.
+        """
+        self.update_from_headers(response.headers)
+
+    def stats(self):
+        self._prune(time.monotonic())
+        return {
+            "concurrency": self.concurrency,
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "rpm_limit": self.rpm,
+            "tpm_limit": self.tpm,
+            "requests_last_minute": len(self._window),
+            "tokens_last_minute": self._window_tokens(),
+            **self.stats_counters,
+        }
+
+
+llm_limiter = AdaptiveLimiter()
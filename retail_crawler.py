@@ -1,8 +1,18 @@
 import asyncio
-from crawler import crawl_site_recursive
+from crawler import crawl_site_recursive, fetch_page
 from kimi_service import kimi_service
-from asset_processor import asset_processor
-from ingest import add_multiple_contents_to_store
+from asset_processor import asset_processor, is_logolike
+from ingest import add_content_to_store, add_multiple_contents_to_store
+from page_state import page_state
+from discovery import sitemap_discovery, is_product_url
+
+# Bounded queues between pipeline stages keep memory flat regardless of max_pages
+PIPELINE_QUEUE_SIZE = 8
+EXTRACT_CONCURRENCY = 4
+IMAGE_CONCURRENCY = 4
+WRITE_CONCURRENCY = 1
+
+_STAGE_DONE = object()
 
 class RetailCrawler:
     def __init__(self):
@@ -25,54 +35,139 @@ class RetailCrawler:
         except Exception:
             return "uncategorized", "general"
 
+    async def _run_stage(self, name, inbox, outbox, handler, concurrency):
+        """
+        Runs `concurrency` workers that pull items from inbox, pass them through handler and
+        push non-None results to outbox. A _STAGE_DONE sentinel shuts the stage down and is
+        forwarded downstream once every worker has finished.
+        """
+        async def worker():
+            while True:
+                item = await inbox.get()
+                if item is _STAGE_DONE:
+                    # Let sibling workers see the sentinel too
+                    await inbox.put(_STAGE_DONE)
+                    return
+                try:
+                    result = await handler(item)
+                except Exception as e:
+                    print(f"ERROR: {name} stage failed: {e}")
+                    continue
+                if result is not None and outbox is not None:
+                    await outbox.put(result)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        if outbox is not None:
+            await outbox.put(_STAGE_DONE)
+
+    async def _mirror_page_image(self, product, candidates, max_attempts=3):
+        """
+        The extracted image could not be mirrored: try the page's own images in order.
+        """
+        tried = {product.get("image_url"), product.get("original_image_url")}
+        for url in [u for u in candidates if u not in tried][:max_attempts]:
+            trial = {"image_url": url}
+            await asset_processor.process_product_images([trial])
+            if trial.get("s3_image_url"):
+                print(f"DEBUG: Using page image {url} for {product.get('name')}")
+                product["image_url"] = trial["image_url"]
+                product["s3_image_url"] = trial["s3_image_url"]
+                return
+
+    def _describe_product(self, product):
+        return (
+            f"Product: {product.get('name')}\n"
+            f"Brand: {product.get('brand')}\n"
+            f"Category: {product.get('category')} / {product.get('subcategory')}\n"
+            f"Price: {product.get('price')} {product.get('currency')}\n"
+            f"Details: {product.get('details')}\n"
+            f"Age: {product.get('age_group')}\n"
+            f"Image URL: {product.get('image_url')}\n"
+            f"Source URL: {product.get('source_url')}"
+        )
+
     async def sync_store(self, seed_url, max_pages=None, target_category="relevant"):
         """
-        Orchestrates the discovery -> crawl -> extract -> upload -> ingest loop.
+        Orchestrates the discovery -> crawl -> extract -> image mirroring -> embed/write pipeline.
+        Stages are connected by bounded queues, so products become searchable while the crawl
+        is still running and only a few pages are held in memory at any time.
         """
         limit = max_pages or self.max_pages
         print(f"Starting sync for: {seed_url} (limit: {limit} pages, category: {target_category})")
-        
-        # 0. Initial Category from Seed URL
-        seed_cat, seed_sub = self._extract_category_info(seed_url)
 
-        # 1. Recursive Crawl
-        pages = await crawl_site_recursive(seed_url, max_pages=limit)
-        if not pages:
-            print(f"No pages found for {seed_url}")
-            return []
-        
-        all_retail_data = []
-        
-        # 2. Concurrent Intelligent Extraction & Asset Processing
-        async def process_single_page(page):
+        # 1. Discovery: sitemaps and product feeds give product-detail URLs without link-following
+        try:
+            seed_urls = await sitemap_discovery.discover(seed_url, target_category=target_category, limit=limit)
+        except Exception as e:
+            print(f"WARNING: Sitemap discovery failed for {seed_url}: {e}")
+            seed_urls = []
+
+        page_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        image_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        write_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        synced_products = []
+        counters = {"pages": 0, "unchanged": 0}
+
+        # 2. Crawl, product URLs first, streaming pages into the pipeline
+        async def crawl_stage():
+            try:
+                await crawl_site_recursive(
+                    seed_url, max_pages=limit, conditional=True,
+                    seed_urls=seed_urls, on_page=page_queue.put
+                )
+            finally:
+                await page_queue.put(_STAGE_DONE)
+
+        # 3. Intelligent extraction
+        async def extract_stage(page):
+            counters["pages"] += 1
             current_url = page.get("url")
-            content = page.get("content", "")
-            
-            # Extract category/subcategory for this specific page
-            page_cat, page_sub = self._extract_category_info(current_url)
-            
-            # Extract structured data via Kimi
-            products = await kimi_service.extract_product_data(content, target_category=target_category)
+            content = page.get("content") or ""
+
+            # Unchanged since the last sync: reuse the stored extraction, skip LLM, S3 and ingestion
+            if page.get("unchanged"):
+                extraction = page_state.get_extraction(current_url, target_category)
+                if extraction is not None:
+                    print(f"DEBUG: Reusing {len(extraction)} stored products for unchanged page {current_url}")
+                    counters["unchanged"] += 1
+                    synced_products.extend(extraction)
+                    return None
+                if not content:
+                    # 304, but the stored products were extracted for another category
+                    page = await fetch_page(current_url)
+                    content = (page or {}).get("content") or ""
+                    if not content:
+                        return None
+                    # The server confirmed the page is the same; its raw text is already stored
+                    page["unchanged"] = True
+
+            products = await asyncio.wait_for(
+                kimi_service.extract_product_data(
+                    content, target_category=target_category, base_url=current_url, html=page.get("html")
+                ),
+                timeout=60
+            )
             print(f"DEBUG: Kimi found {len(products or [])} raw products on {current_url}")
-            
-            # NEW: Also ingest the RAW page content to ensure we have a fallback even if structured extraction fails
-            # This uses the new async add_content_to_store which processes images globally for the page
-            from ingest import add_content_to_store
-            await add_content_to_store(content, {
-                "source": current_url,
-                "category": page_cat,
-                "subcategory": page_sub,
-                "type": "raw_retail_page"
-            })
-
-            # Process images for structured products if any were found
+            return page, products or []
+
+        # 4. Image mirroring to S3
+        async def image_stage(item):
+            page, products = item
+            current_url = page["url"]
+            page_cat, page_sub = self._extract_category_info(current_url)
+
+            # On a product detail page the page's own <img> URLs are candidates for its single product
+            page_images = []
+            if len(products) == 1 and is_product_url(current_url):
+                page_images = [u for u in page.get("image_urls") or [] if not is_logolike(u)]
+                if page_images and not products[0].get("image_url"):
+                    products[0]["image_url"] = page_images[0]
+
             processed_products = []
             if products:
-                processed_products = asset_processor.process_product_images(
-                    products, 
-                    category=page_cat, 
-                    subcategory=page_sub
-                )
+                processed_products = await asset_processor.process_product_images(products)
+            if page_images and len(processed_products) == 1 and not processed_products[0].get("s3_image_url"):
+                await self._mirror_page_image(processed_products[0], page_images)
             
             final_products = []
             for p in processed_products:
@@ -90,45 +185,45 @@ class RetailCrawler:
                     if key in p: del p[key]
                 final_products.append(p)
             print(f"DEBUG: Successfully processed {len(final_products)} products with S3 images from {current_url}")
-            return final_products
+            return page, final_products
 
-        semaphore = asyncio.Semaphore(5)
-        async def sem_process(page):
-            async with semaphore:
-                try:
-                    return await asyncio.wait_for(process_single_page(page), timeout=60)
-                except Exception as e:
-                    print(f"ERROR: Timed out or failed processing {page.get('url')}: {e}")
-                    return []
-
-        tasks = [sem_process(page) for page in pages]
-        results = await asyncio.gather(*tasks)
-        for product_list in results:
-            if product_list:
-                all_retail_data.extend(product_list)
-        
-        if all_retail_data:
-            ingest_items = []
-            for product in all_retail_data:
-                # ... (description formatting)
-                description = (
-                    f"Product: {product.get('name')}\n"
-                    f"Brand: {product.get('brand')}\n"
-                    f"Category: {product.get('category')} / {product.get('subcategory')}\n"
-                    f"Price: {product.get('price')} {product.get('currency')}\n"
-                    f"Details: {product.get('details')}\n"
-                    f"Age: {product.get('age_group')}\n"
-                    f"Image URL: {product.get('image_url')}\n"
-                    f"Source URL: {product.get('source_url')}"
-                )
-                ingest_items.append({
-                    "content": description,
-                    "url": product.get("source_url"),
-                    "metadata": product
+        # 5. Embed and write: raw page fallback plus structured products, one page at a time
+        async def write_stage(item):
+            page, final_products = item
+            current_url = page["url"]
+            page_cat, page_sub = self._extract_category_info(current_url)
+
+            # Also ingest the RAW page content to ensure we have a fallback even if structured extraction fails.
+            # Unchanged pages re-extracted for another category already have it in the store
+            if not page.get("unchanged"):
+                await add_content_to_store(page["content"], {
+                    "source": current_url,
+                    "category": page_cat,
+                    "subcategory": page_sub,
+                    "type": "raw_retail_page"
                 })
-            await add_multiple_contents_to_store(ingest_items)
-            print(f"Successfully synced {len(all_retail_data)} products from {seed_url}")
-            return all_retail_data
-        return []
+            if final_products:
+                await add_multiple_contents_to_store([
+                    {"content": self._describe_product(p), "url": p.get("source_url"), "metadata": p}
+                    for p in final_products
+                ])
+            # Only now that ingestion succeeded is this page safe to skip next time
+            page_state.save(current_url, page, products=final_products, category=target_category)
+            synced_products.extend(final_products)
+            return None
+
+        await asyncio.gather(
+            crawl_stage(),
+            self._run_stage("extract", page_queue, image_queue, extract_stage, EXTRACT_CONCURRENCY),
+            self._run_stage("images", image_queue, write_queue, image_stage, IMAGE_CONCURRENCY),
+            self._run_stage("write", write_queue, None, write_stage, WRITE_CONCURRENCY),
+        )
+
+        if not counters["pages"]:
+            print(f"No pages found for {seed_url}")
+            return []
+        print(f"Successfully synced {len(synced_products)} products from {seed_url} "
+              f"({counters['pages']} pages, {counters['unchanged']} unchanged)")
+        return synced_products
 
 retail_crawler = RetailCrawler()
@@ -15,6 +15,23 @@ class S3Service:
         )
         self.bucket_name = os.getenv("S3_BUCKET_NAME")
 
+    def public_url(self, file_name):
+        # Construct URL using the specified region (recommended for Mumbai and others)
+        region = os.getenv("AWS_REGION", "us-east-1")
+        if region == "us-east-1":
+            return f"https://{self.bucket_name}.s3.amazonaws.com/{file_name}"
+        return f"https://{self.bucket_name}.s3.{region}.amazonaws.com/{file_name}"
+
+    def object_exists(self, file_name):
+        """
+        HEAD the key; used to skip re-uploading content-addressed objects.
+        """
+        try:
+            self.s3.head_object(Bucket=self.bucket_name, Key=file_name)
+            return True
+        except Exception:
+            return False
+
     def upload_image(self, file_content, file_name, content_type='image/jpeg'):
         """
         Uploads an image to S3 and returns the public URL.
@@ -27,13 +44,7 @@ class S3Service:
                 ContentType=content_type
             )
             
-            # Construct URL using the specified region (recommended for Mumbai and others)
-            region = os.getenv("AWS_REGION", "us-east-1")
-            if region == "us-east-1":
-                url = f"https://{self.bucket_name}.s3.amazonaws.com/{file_name}"
-            else:
-                url = f"https://{self.bucket_name}.s3.{region}.amazonaws.com/{file_name}"
-                
+            url = self.public_url(file_name)
             print(f"Successfully uploaded to S3: {url}")
             return url
         except NoCredentialsError:
@@ -0,0 +1,208 @@
+import json
+import re
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+
+# Fields a product needs before we trust structured data and skip the LLM
+REQUIRED_FIELDS = ("name", "price", "image_url")
+
+_JSON_LD_RE = re.compile(
+    r"""<script[^>]*type\s*=\s*["']application/ld\+json["'][^>]*>(.*?)</script>""",
+    re.IGNORECASE | re.DOTALL
+)
+
+
+def _first(value):
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _text(value):
+    value = _first(value)
+    if isinstance(value, dict):
+        value = value.get("name") or value.get("@id")
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _image(value):
+    value = _first(value)
+    if isinstance(value, dict):
+        value = value.get("url") or value.get("contentUrl")
+    return _text(value)
+
+
+def _has_type(node, type_name):
+    types = node.get("@type")
+    if not isinstance(types, list):
+        types = [types]
+    return any(isinstance(t, str) and t.split("/")[-1] == type_name for t in types)
+
+
+def _offer_price(offers):
+    """
+    Returns (price, currency) from an Offer, AggregateOffer or a list of offers.
+    """
+    for offer in offers if isinstance(offers, list) else [offers]:
+        if not isinstance(offer, dict):
+            continue
+        price = offer.get("price") or offer.get("lowPrice")
+        currency = offer.get("priceCurrency")
+        spec = _first(offer.get("priceSpecification"))
+        if price is None and isinstance(spec, dict):
+            price = spec.get("price")
+            currency = currency or spec.get("priceCurrency")
+        if price is not None:
+            return _text(price), _text(currency)
+    return None, None
+
+
+def _product_from_json_ld(node, base_url):
+    offers = node.get("offers")
+    if offers is None and node.get("hasVariant"):
+        offers = [v.get("offers") for v in node["hasVariant"] if isinstance(v, dict)]
+    price, currency = _offer_price(offers) if offers else (None, None)
+    url = _text(node.get("url")) or base_url
+    image_url = _image(node.get("image"))
+    return {
+        "name": _text(node.get("name")),
+        "price": price,
+        "currency": currency,
+        "brand": _text(node.get("brand")),
+        "image_url": urljoin(base_url, image_url) if image_url and base_url else image_url,
+        "url": urljoin(base_url, url) if url and base_url else url,
+        "details": _text(node.get("description")),
+    }
+
+
+def _walk_json_ld(node, found):
+    if isinstance(node, list):
+        for item in node:
+            _walk_json_ld(item, found)
+    elif isinstance(node, dict):
+        if _has_type(node, "Product") or _has_type(node, "ProductGroup"):
+            found.append(node)
+            return
+        for key in ("@graph", "itemListElement", "item", "mainEntity"):
+            if key in node:
+                _walk_json_ld(node[key], found)
+
+
+def extract_json_ld(html, base_url=None):
+    nodes = []
+    for raw in _JSON_LD_RE.findall(html):
+        try:
+            data = json.loads(raw.strip())
+        except ValueError:
+            # Some sites emit trailing commas or control characters; skip rather than guess
+            continue
+        _walk_json_ld(data, nodes)
+    return [_product_from_json_ld(node, base_url) for node in nodes]
+
+
+def _own_props(scope):
+    """
+    itemprop elements that belong to this itemscope, not to a nested item.
+    """
+    props = {}
+    for el in scope.find_all(attrs={"itemprop": True}):
+        if el.find_parent(attrs={"itemscope": True}) is not scope:
+            continue
+        for name in el["itemprop"].split():
+            props.setdefault(name, el)
+    return props
+
+
+def _prop_value(el):
+    if el is None:
+        return None
+    if el.has_attr("itemscope"):
+        name = _own_props(el).get("name")
+        return _prop_value(name) if name else None
+    for attr in ("content", "src", "href"):
+        if el.get(attr):
+            return el[attr].strip()
+    return el.get_text(" ", strip=True) or None
+
+
+def extract_microdata(soup, base_url=None):
+    products = []
+    for scope in soup.find_all(attrs={"itemscope": True, "itemtype": re.compile(r"schema\.org/Product", re.I)}):
+        props = _own_props(scope)
+        offer_props = _own_props(props["offers"]) if "offers" in props and props["offers"].has_attr("itemscope") else {}
+        price_el = props.get("price") or offer_props.get("price") or offer_props.get("lowPrice")
+        currency_el = props.get("priceCurrency") or offer_props.get("priceCurrency")
+        image_url = _prop_value(props.get("image"))
+        url = _prop_value(props.get("url")) or base_url
+        products.append({
+            "name": _prop_value(props.get("name")),
+            "price": _prop_value(price_el),
+            "currency": _prop_value(currency_el),
+            "brand": _prop_value(props.get("brand")),
+            "image_url": urljoin(base_url, image_url) if image_url and base_url else image_url,
+            "url": urljoin(base_url, url) if url and base_url else url,
+            "details": _prop_value(props.get("description")),
+        })
+    return products
+
+
+def extract_open_graph(soup, base_url=None):
+    meta = {}
+    for tag in soup.find_all("meta"):
+        key = tag.get("property") or tag.get("name")
+        if key and tag.get("content") and key.lower() not in meta:
+            meta[key.lower()] = tag["content"].strip()
+    price = meta.get("product:price:amount") or meta.get("og:price:amount")
+    if "product" not in meta.get("og:type", "") and not price:
+        return []
+    image_url = meta.get("og:image")
+    url = meta.get("og:url") or base_url
+    return [{
+        "name": meta.get("og:title"),
+        "price": price,
+        "currency": meta.get("product:price:currency") or meta.get("og:price:currency"),
+        "brand": meta.get("product:brand") or meta.get("og:brand"),
+        "image_url": urljoin(base_url, image_url) if image_url and base_url else image_url,
+        "url": urljoin(base_url, url) if url and base_url else url,
+        "details": meta.get("og:description"),
+    }]
+
+
+def is_complete(product):
+    return all(product.get(field) for field in REQUIRED_FIELDS)
+
+
+def extract_structured_products(html, base_url=None):
+    """
+    Pulls products out of JSON-LD, microdata and OpenGraph tags, in that order of trust.
+    Returns dicts in the same shape as the LLM extraction (name, price, brand, image_url, url, ...).
+    Later sources only fill fields the earlier ones left empty.
+    """
+    if not html:
+        return []
+    products = [p for p in extract_json_ld(html, base_url) if p.get("name")]
+    soup = BeautifulSoup(html, "html.parser")
+    if not products:
+        products = [p for p in extract_microdata(soup, base_url) if p.get("name")]
+
+    # A single-product page: OpenGraph can supply a missing image or price
+    og = extract_open_graph(soup, base_url)
+    if og and len(products) <= 1:
+        if not products:
+            products = [p for p in og if p.get("name")]
+        else:
+            for key, value in og[0].items():
+                if not products[0].get(key) and value:
+                    products[0][key] = value
+
+    unique = []
+    seen = set()
+    for p in products:
+        key = (p.get("name"), p.get("url"))
+        if key not in seen:
+            seen.add(key)
+            unique.append(p)
+    return unique
@@ -0,0 +1,76 @@
+from crawler import fetch_page, crawl_site_recursive
+from ingest import add_content_to_store, add_multiple_contents_to_store
+from kimi_service import kimi_service
+from page_state import page_state
+
+
+async def background_ingest(url: str, max_pages: int = 1, job=None):
+    """
+    Crawls and ingests one page, or a whole site when max_pages > 1.
+    Deep crawls ingest each page as it arrives and checkpoint the frontier through `job`,
+    so an interrupted crawl resumes where it stopped.
+    """
+    try:
+        print(f"Background ingestion started for: {url} (max_pages={max_pages})")
+        if max_pages <= 1:
+            page = await fetch_page(url, conditional=True)
+            if page and page.get("unchanged"):
+                print(f"Skipping ingestion for {url}: unchanged since last crawl")
+                return {"pages": 1, "ingested": 0}
+            elif page and page["content"] and len(page["content"].strip()) > 10:
+                await add_content_to_store(page["content"], {"source": url})
+                page_state.save(url, page)
+                return {"pages": 1, "ingested": 1}
+            return {"pages": 0, "ingested": 0}
+
+        counts = {"pages": 0, "ingested": 0}
+
+        async def ingest_page(page):
+            counts["pages"] += 1
+            if not page.get("unchanged"):
+                await add_multiple_contents_to_store([page])
+                page_state.save(page["url"], page)
+                counts["ingested"] += 1
+            if job:
+                await job.report_progress({**counts, "max_pages": max_pages, "last_url": page["url"]})
+
+        await crawl_site_recursive(
+            url, max_pages=max_pages, conditional=True, on_page=ingest_page,
+            checkpoint=job.checkpoint if job else None,
+            on_checkpoint=job.save_checkpoint if job else None
+        )
+        print(f"Deep crawl of {url}: {counts['ingested']} changed, {counts['pages'] - counts['ingested']} unchanged pages")
+        print(f"Background deep ingestion complete for {url}")
+        return counts
+    except Exception as e:
+        print(f"Error in background ingestion for {url}: {e}")
+        raise
+
+
+async def background_crawl_and_ingest(query: str, fast_products: list, job=None):
+    try:
+        print(f"🔄 BACKGROUND: Starting deep crawl for '{query}'...")
+        deep_results, page_updates = await kimi_service.run_deep_crawl_process(query, fast_products)
+        stored = True
+        if deep_results:
+            print(f"🔄 BACKGROUND: Deep crawl yielded {len(deep_results)} rich products. Saving to DB...")
+            stored = await kimi_service.cache_and_store_products(deep_results, query)
+        # Only pages whose products made it into the store may be skipped as unchanged next time
+        if stored:
+            for page, products in page_updates:
+                page_state.save(page["url"], page, products=products, category=query)
+        print(f"✅ BACKGROUND: Completely finished processing '{query}'!")
+        return {"products": len(deep_results or [])}
+    except Exception as e:
+        print(f"❌ BACKGROUND: Failed deep crawl for '{query}': {e}")
+        import traceback
+        traceback.print_exc()
+        raise
+
+
+# Job kind -> (handler, max concurrent jobs of that kind in one worker)
+JOB_HANDLERS = {
+    "crawl": (lambda payload, job: background_ingest(payload["url"], max_pages=1, job=job), 2),
+    "deep_crawl": (lambda payload, job: background_ingest(payload["url"], max_pages=payload.get("max_pages", 15), job=job), 1),
+    "live_enrich": (lambda payload, job: background_crawl_and_ingest(payload["query"], payload["products"], job=job), 2),
+}
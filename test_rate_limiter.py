@@ -0,0 +1,26 @@
+import asyncio
+import time
+
+import rate_limiter
+from rate_limiter import AdaptiveLimiter
+
+
+def test_token_budget_wait_ends_when_window_expires(monkeypatch):
+    """
+    A call that does not fit the remaining token budget must wake up once the window rolls
+    over, even though no other call is active to notify it.
+    """
+    monkeypatch.setattr(rate_limiter, "WINDOW_SECONDS", 0.2)
+    limiter = AdaptiveLimiter(rpm=100, tpm=10000, initial_concurrency=4)
+
+    async def run():
+        async with limiter.slot(tokens=9000):
+            pass
+        start = time.monotonic()
+        async with limiter.slot(tokens=2000):
+            pass
+        return time.monotonic() - start
+
+    waited = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert 0.1 <= waited < 5
+    assert limiter.active == 0
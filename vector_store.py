@@ -37,3 +37,6 @@ def clear_vector_store():
             print("Vector store is already empty.")
     except Exception as e:
         print(f"Error clearing vector store: {e}")
+    # Otherwise conditional fetches keep reporting 'unchanged' and nothing is re-ingested
+    from page_state import page_state
+    page_state.clear()
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from job_queue import job_queue, JobContext
+from tasks import JOB_HANDLERS
+from browser_pool import browser_pool
+from http_fetcher import http_fetcher
+from asset_processor import asset_processor
+from image_cache import image_cache
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 3))
+POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", 1.0))
+HEARTBEAT_INTERVAL = 30
+# A running job without a heartbeat for this long belonged to a dead worker
+STALE_JOB_TIMEOUT = int(os.getenv("WORKER_STALE_TIMEOUT", 300))
+
+
+async def _heartbeat(job_id):
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        job_queue.heartbeat(job_id)
+
+
+async def run_job(job, running):
+    handler, _ = JOB_HANDLERS[job["kind"]]
+    start_time = time.time()
+    print(f"🧰 WORKER: Starting {job['kind']} job {job['id']} (attempt {job['attempts']})")
+    heartbeat = asyncio.create_task(_heartbeat(job["id"]))
+    try:
+        result = await handler(job["payload"], JobContext(job_queue, job))
+        job_queue.complete(job["id"], result)
+        print(f"✅ WORKER: {job['kind']} job {job['id']} done in {time.time() - start_time:.2f}s")
+    except Exception as e:
+        job_queue.fail(job["id"], e)
+        print(f"❌ WORKER: {job['kind']} job {job['id']} failed: {e}")
+    finally:
+        heartbeat.cancel()
+        running[job["kind"]] -= 1
+
+
+async def main():
+    """
+    Pulls jobs from the shared queue and runs them with a global and per-kind concurrency cap,
+    so a burst of deep crawls cannot starve quick single-page ingests.
+    """
+    await browser_pool.start()
+    running = {kind: 0 for kind in JOB_HANDLERS}
+    tasks = set()
+    last_recovery = 0
+    print(f"🧰 WORKER: Listening for jobs (concurrency {WORKER_CONCURRENCY})")
+    try:
+        while True:
+            if time.time() - last_recovery > HEARTBEAT_INTERVAL:
+                recovered = job_queue.requeue_stale(timeout=STALE_JOB_TIMEOUT)
+                if recovered:
+                    print(f"🧰 WORKER: Re-queued {recovered} interrupted jobs")
+                last_recovery = time.time()
+
+            job = None
+            if len(tasks) < WORKER_CONCURRENCY:
+                kinds = [kind for kind, (_, limit) in JOB_HANDLERS.items() if running[kind] < limit]
+                job = job_queue.claim(kinds)
+            if job is None:
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+
+            running[job["kind"]] += 1
+            task = asyncio.create_task(run_job(job, running))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await browser_pool.close()
+        await http_fetcher.close()
+        await asset_processor.close()
+        image_cache.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("🧰 WORKER: Stopped")
@@ -0,0 +1,315 @@
+import sqlite3
+import json
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from urllib.parse import urljoin, urlparse
+from bs4 import BeautifulSoup
+from discovery import is_product_url
+from frontier import canonicalize_url
+
+# Fields we learn selectors for; name and price must resolve before a template is trusted
+TEMPLATE_FIELDS = ("name", "price", "brand", "image_url")
+REQUIRED_TEMPLATE_FIELDS = ("name", "price")
+# The same selector must be induced on this many LLM-extracted pages before it is used
+MIN_CONSISTENT_SAMPLES = 2
+# Consecutive misses or validation mismatches before a template is thrown away and re-learned
+MAX_TEMPLATE_FAILURES = 3
+
+_SAFE_NAME_RE = re.compile(r"^[A-Za-z][A-Za-z_-]*$")
+
+
+def _normalize_text(value):
+    return re.sub(r"\s+", " ", str(value or "")).strip().lower()
+
+
+def _price_digits(value):
+    return re.sub(r"\D", "", str(value or "")).lstrip("0")
+
+
+def _page_type(url):
+    return "product" if is_product_url(url) else "page"
+
+
+def _css_segment(el):
+    classes = [c for c in el.get("class", []) if _SAFE_NAME_RE.match(c)][:2]
+    segment = el.name + "".join(f".{c}" for c in classes)
+    parent = el.parent
+    if parent is not None:
+        siblings = parent.find_all(el.name, recursive=False)
+        same = [s for s in siblings if [c for c in s.get("class", []) if _SAFE_NAME_RE.match(c)][:2] == classes]
+        if len(same) > 1:
+            index = next(i for i, s in enumerate(siblings) if s is el) + 1
+            segment += f":nth-of-type({index})"
+    return segment
+
+
+def css_path(el):
+    """
+    Builds a CSS selector for el, anchored at the nearest ancestor with a stable id.
+    Hash-like classes and ids (containing digits) are ignored since they change between deploys.
+    """
+    parts = []
+    while el is not None and el.name not in (None, "[document]", "html"):
+        el_id = el.get("id")
+        if el_id and _SAFE_NAME_RE.match(el_id):
+            parts.append(f"{el.name}#{el_id}")
+            break
+        parts.append(_css_segment(el))
+        el = el.parent
+    return " > ".join(reversed(parts))
+
+
+def _find_text_node(soup, value, field):
+    """
+    Deepest element whose text matches the extracted value.
+    """
+    if field == "price":
+        target = _price_digits(value)
+        if not target:
+            return None
+        matches = [el for el in soup.find_all(True)
+                   if len(el.get_text(strip=True)) <= 40 and _price_digits(el.get_text()) == target]
+    else:
+        target = _normalize_text(value)
+        if not target:
+            return None
+        matches = []
+        for el in soup.find_all(True):
+            if el.name in ("script", "style", "title", "head", "meta"):
+                continue
+            text = _normalize_text(el.get_text(" "))
+            if text == target or (target in text and len(text) <= len(target) * 1.5):
+                matches.append(el)
+    # Ancestors of the real node match too; keep only matches with no matching descendant
+    matched = {id(el) for el in matches}
+    leaves = [el for el in matches if not any(id(child) in matched for child in el.find_all(True))]
+    return leaves[0] if leaves else None
+
+
+def _find_image_node(soup, image_url, base_url):
+    if not image_url:
+        return None
+    target = urlparse(urljoin(base_url, image_url)).path
+    for img in soup.find_all("img"):
+        for attr in ("src", "data-src", "data-original", "data-lazy"):
+            if img.get(attr) and urlparse(urljoin(base_url, img[attr])).path == target:
+                return img
+    return None
+
+
+def _read_field(soup, selector, field, base_url):
+    el = soup.select_one(selector)
+    if el is None:
+        return None
+    if field == "image_url":
+        for attr in ("src", "data-src", "data-original", "data-lazy"):
+            if el.get(attr):
+                return urljoin(base_url, el[attr])
+        return None
+    return el.get_text(" ", strip=True) or None
+
+
+class WrapperInduction:
+    """
+    Learns per-domain CSS selectors for product fields from LLM extractions, so later
+    pages with the same layout are extracted locally. A sample of template extractions
+    is still checked against the LLM; templates that stop matching are dropped and re-learned.
+    """
+    def __init__(self, db_path="wrapper_templates.sqlite3", validation_rate=None):
+        self.db_path = db_path
+        self.validation_rate = validation_rate if validation_rate is not None else float(os.getenv("WRAPPER_VALIDATION_RATE", 0.1))
+        self._init_db()
+
+    def _init_db(self):
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS templates (
+                        domain TEXT NOT NULL,
+                        page_type TEXT NOT NULL,
+                        candidates TEXT NOT NULL,
+                        hits INTEGER DEFAULT 0,
+                        failures INTEGER DEFAULT 0,
+                        updated_at REAL,
+                        PRIMARY KEY (domain, page_type)
+                    )
+                ''')
+        except Exception as e:
+            print(f"Error initializing wrapper template DB: {e}")
+
+    def _key(self, url):
+        return urlparse(url).netloc.lower(), _page_type(url)
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Read-modify-write of a template under a write lock, so concurrent pages (threads or
+        the API and worker processes) cannot overwrite each other's counts.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _load(self, url, conn=None):
+        try:
+            if conn is None:
+                with sqlite3.connect(self.db_path) as own_conn:
+                    return self._load(url, own_conn)
+            row = conn.execute(
+                "SELECT candidates, hits, failures FROM templates WHERE domain = ? AND page_type = ?",
+                self._key(url)
+            ).fetchone()
+            if row:
+                return {"candidates": json.loads(row[0]), "hits": row[1], "failures": row[2]}
+        except Exception as e:
+            print(f"Error reading wrapper template: {e}")
+        return None
+
+    def _store(self, conn, url, template):
+        conn.execute(
+            "INSERT OR REPLACE INTO templates (domain, page_type, candidates, hits, failures, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (*self._key(url), json.dumps(template["candidates"]), template["hits"], template["failures"], time.time())
+        )
+
+    def _selectors(self, template):
+        """
+        The most frequently induced selector per field, once it has been seen often enough.
+        """
+        selectors = {}
+        for field, counts in template["candidates"].items():
+            selector, count = max(counts.items(), key=lambda item: item[1])
+            if count >= MIN_CONSISTENT_SAMPLES:
+                selectors[field] = selector
+        return selectors
+
+    def _record_failure(self, conn, url, template, reason):
+        """
+        Counts a miss and returns the template as stored (reset once it failed too often).
+        """
+        template["failures"] += 1
+        if template["failures"] >= MAX_TEMPLATE_FAILURES:
+            domain, page_type = self._key(url)
+            print(f"DEBUG: Wrapper template for {domain} ({page_type}) stopped matching ({reason}), re-learning")
+            template = {"candidates": {}, "hits": 0, "failures": 0}
+        self._store(conn, url, template)
+        return template
+
+    def apply(self, html, url):
+        """
+        Extracts a product with the learned template for this domain and page type.
+        Returns None when no trusted template exists or it no longer matches the page.
+        Only product detail pages are templated: a template yields a single product,
+        which on a listing page would drop every other product.
+        """
+        if _page_type(url) != "product":
+            return None
+        template = self._load(url)
+        if not template:
+            return None
+        selectors = self._selectors(template)
+        if not all(field in selectors for field in REQUIRED_TEMPLATE_FIELDS):
+            return None
+
+        # Parsing happens outside the write lock; only the counter update is serialized
+        soup = BeautifulSoup(html, "html.parser")
+        product = {"url": url}
+        for field, selector in selectors.items():
+            try:
+                product[field] = _read_field(soup, selector, field, url)
+            except Exception:
+                product[field] = None
+        matched = all(product.get(field) for field in REQUIRED_TEMPLATE_FIELDS)
+
+        try:
+            with self._transaction() as conn:
+                current = self._load(url, conn)
+                if current is not None:
+                    if matched:
+                        current["hits"] += 1
+                        self._store(conn, url, current)
+                    else:
+                        self._record_failure(conn, url, current, "selectors missed")
+        except Exception as e:
+            print(f"Error saving wrapper template: {e}")
+        return product if matched else None
+
+    def should_validate(self):
+        return random.random() < self.validation_rate
+
+    def _target_product(self, url, products):
+        """
+        The product this page is about: the one pointing back at the page, or the only one.
+        """
+        page = canonicalize_url(url)
+        for p in products:
+            if p.get("url") and canonicalize_url(urljoin(url, p["url"])) == page:
+                return p
+        return products[0] if len(products) == 1 else None
+
+    def learn(self, html, url, products, template_product=None):
+        """
+        Aligns the LLM-extracted fields to DOM nodes and records the induced selectors.
+        When template_product is given, it is first checked against the LLM result.
+        Listing pages are never learned, even when the LLM found a single product on them.
+        """
+        if _page_type(url) != "product":
+            return
+        target = self._target_product(url, products or [])
+
+        induced = {}
+        if target is not None:
+            soup = BeautifulSoup(html, "html.parser")
+            for field in TEMPLATE_FIELDS:
+                if field == "image_url":
+                    node = _find_image_node(soup, target.get("image_url"), url)
+                else:
+                    node = _find_text_node(soup, target.get(field), field)
+                if node is not None:
+                    induced[field] = css_path(node)
+
+        try:
+            with self._transaction() as conn:
+                template = self._load(url, conn) or {"candidates": {}, "hits": 0, "failures": 0}
+                if template_product is not None:
+                    matches = target is not None and (
+                        _normalize_text(template_product.get("name")) == _normalize_text(target.get("name"))
+                        and _price_digits(template_product.get("price")) == _price_digits(target.get("price"))
+                    )
+                    if not matches:
+                        template = self._record_failure(conn, url, template, "validation mismatch")
+                    else:
+                        template["failures"] = 0
+                for field, selector in induced.items():
+                    counts = template["candidates"].setdefault(field, {})
+                    counts[selector] = counts.get(selector, 0) + 1
+                self._store(conn, url, template)
+        except Exception as e:
+            print(f"Error saving wrapper template: {e}")
+
+    def stats(self):
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                rows = conn.execute("SELECT candidates, hits FROM templates").fetchall()
+        except Exception:
+            return {}
+        active = 0
+        for candidates, _ in rows:
+            selectors = self._selectors({"candidates": json.loads(candidates)})
+            if all(field in selectors for field in REQUIRED_TEMPLATE_FIELDS):
+                active += 1
+        return {"templates": len(rows), "active": active, "hits": sum(r[1] for r in rows)}
+
+
+wrapper_induction = WrapperInduction()